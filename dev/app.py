@@ -3,12 +3,12 @@ from ga import GeneticAlgorithmParameters
 from parameters import LSystemParameters
 from constant import *
 
-from typing import List, Callable
+from typing import List, Callable, Union
 
 from PySide6 import QtCore, QtWidgets
 from PySide6.QtWidgets import (QCheckBox, QInputDialog, QMainWindow, QApplication, QGridLayout, QMessageBox, QSizePolicy, QWidget, QPushButton, QLabel,
                                QLineEdit, QSlider, QComboBox, QGroupBox, QHBoxLayout, QAbstractSlider,
-                               QFrame, QFormLayout, QVBoxLayout, QDockWidget)
+                               QFrame, QFormLayout, QVBoxLayout, QDockWidget, QFileDialog)
 from PySide6.QtCore import Qt, Slot, Signal, QSize
 from PySide6.QtGui import (QPixmap, QImage, QColor, QRegularExpressionValidator, QValidator, QIcon)
 
@@ -56,11 +56,12 @@ class LSystemPanel(QGroupBox):
         self._lsystem_controls = LSystemControls("Controles")
         self._first_prob_sliderbox = SliderBox(0.1, 1, .1)
         self._second_prob_sliderbox = SliderBox(0.1, 1, .1)
-        self._iterations_sliderbox = SliderBox(1, Constant.MAX_ITERATIONS, 1)
+        self._iterations_sliderbox = SliderBox(1, Constant.MAX_LAZY_ITERATIONS, 1)
         self._angle_sliderbox = SliderBox(15, 90 , .1)
         self._first_rule_edit = QLineEdit()
         self._second_rule_edit = QLineEdit()
         self._axiom_edit = QLineEdit()
+        self._seed_edit = QLineEdit()
         self._shape_rgbabox = RGBABox()
         self._bg_rgbabox = RGBABox()
         self._parameters = LSystemParameters()
@@ -93,6 +94,8 @@ class LSystemPanel(QGroupBox):
         layout.add_row(QLabel("Angle"), self._angle_sliderbox)
         layout.add_row(QLabel("Probabilité 1"), self._first_prob_sliderbox)
         layout.add_row(QLabel("Probabilité 2"), self._second_prob_sliderbox)
+        layout.add_row(QLabel("Graine"), self._seed_edit)
+        self._seed_edit.set_validator(QRegularExpressionValidator("^[0-9]{1,9}$"))
         layout.add_row(QLabel("Formes enregistrées"), self._saved_lsystems)
         layout.add_row(QLabel("Couleur fond"), self._bg_rgbabox)
         layout.add_row(QLabel("Couleur forme"), self._shape_rgbabox)
@@ -103,6 +106,7 @@ class LSystemPanel(QGroupBox):
         self._axiom_edit.textChanged.connect(self._update_parameters)
         self._first_rule_edit.textChanged.connect(self._update_parameters)
         self._second_rule_edit.textChanged.connect(self._update_parameters)
+        self._seed_edit.textChanged.connect(self._update_parameters)
         self._iterations_sliderbox.get_slider.valueChanged.connect(self._update_parameters)
         self._angle_sliderbox.get_slider.valueChanged.connect(self._update_parameters)
         self._first_prob_sliderbox.get_slider.valueChanged.connect(self._update_parameters)
@@ -150,6 +154,7 @@ class LSystemPanel(QGroupBox):
         self._parameters.angle = float(self._angle_sliderbox.current_value)
         self._parameters.probability_one = float(self._first_prob_sliderbox.current_value)
         self._parameters.probability_two = float(self._second_prob_sliderbox.current_value)
+        self._parameters.seed = int(self._seed_edit.text) if self._seed_edit.text else Constant.INITIAL_SEED
         self._parameters.polygon_shape = None
         r, g, b, a = self._bg_rgbabox.color_components
         self._parameters.bg_color = QColor(int(r), int(g), int(b), int(a))
@@ -183,6 +188,7 @@ class LSystemPanel(QGroupBox):
     def _start_button_command(self):
         try:
             self.controller.render_image()
+            self._seed_edit.placeholder_text = f"{self.controller.seed}"
         except ValueError as e:
             QMessageBox.warning(self, "Erreur", f"{e}")
 
@@ -208,6 +214,16 @@ class LSystemControls(QGroupBox):
 
 
 class SimulationPanel(QGroupBox):
+    """
+    Les images tracées hors du fil graphique sont transmises par image_ready, les erreurs par
+    render_failed; la connexion est alors mise en file et seul l'affichage se fait dans le fil
+    graphique. Les images d'un tracé progressif passent par frame_ready avec la génération de
+    tracé qui les a produites : celles d'un tracé abandonné, encore en file, sont ignorées.
+    """
+    image_ready = Signal(QImage)
+    frame_ready = Signal(QImage, int)
+    render_failed = Signal(str)
+
     def __init__(self, title: str, parent: QWidget = None):
         super().__init__(title, parent)
         self._pixmap = QPixmap(Constant.IMAGE_WIDTH, Constant.IMAGE_HEIGHT)
@@ -215,19 +231,43 @@ class SimulationPanel(QGroupBox):
         self._pixmap.fill(color)
         self._color_label = QLabel()
         self.update(self._pixmap)
+        self._render_generation: int = 0
+        self.image_ready.connect(self.update)
+        self.frame_ready.connect(self._show_frame)
+        self.render_failed.connect(self._show_error)
 
         layout = QFormLayout(self)
 
         layout.add_row(self._color_label)
 
-    def update(self, image: QPixmap) -> None:
-        self._pixmap = image
+    def update(self, image: Union[QPixmap, QImage]) -> None:
+        self._pixmap = QPixmap.from_image(image) if isinstance(image, QImage) else image
         self._color_label.pixmap = self._pixmap
 
     @property
     def simulation_image(self) -> QPixmap:
         return self._pixmap
 
+    @property
+    def render_generation(self) -> int:
+        return self._render_generation
+
+    def next_render_generation(self) -> int:
+        """
+        Périme les images des tracés précédents; à appeler depuis le fil graphique.
+        """
+        self._render_generation += 1
+        return self._render_generation
+
+    @Slot(QImage, int)
+    def _show_frame(self, image: QImage, render_generation: int) -> None:
+        if render_generation == self._render_generation:
+            self.update(image)
+
+    @Slot(str)
+    def _show_error(self, message: str) -> None:
+        QMessageBox.warning(self, "Erreur", message)
+
 
 class FitnessSelector(QGroupBox):
     def __init__(self, title: str):
@@ -302,7 +342,11 @@ class GAPanel(QGroupBox):
 
     @Slot()
     def _save_button_command(self):
-        if not self.controller.save_ga_image():
+        path, _ = QFileDialog.get_save_file_name(self, "Exporter", Constant.IMAGE_SAVE_PATH,
+                                                 "Images PNG (*.png);;Images SVG (*.svg)")
+        if not path:
+            return
+        if not self.controller.save_ga_image(path):
             QMessageBox.warning(self, "Erreur", "Image n'a pu être sauvée")
 
     @Slot()
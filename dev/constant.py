@@ -1,3 +1,4 @@
+import os
 from typing import List
 
 
@@ -9,11 +10,17 @@ class Constant:
     FUNCTION_SET: List[str] = ["[", "]"]
     ALPHABET = TERMINAL_SET + FUNCTION_SET
     PLACEHOLDER = "$"
+    SYMBOLS = ALPHABET + [PLACEHOLDER]
+    SYMBOL_CODES = {symbol: code for code, symbol in enumerate(SYMBOLS)}
 
     """
     Constantes transformation
     """
     MAX_ITERATIONS: int = 7
+    MAX_LAZY_ITERATIONS: int = 12
+    MAX_DERIVED_LENGTH: int = 50_000_000
+    DERIVATION_CACHE_BUDGET: int = 64_000_000
+    CONTEXT_IGNORE: str = "+-"
 
     """
     Constantes LSystem
@@ -30,15 +37,25 @@ class Constant:
     MIN_ELITISM_RATE = 0.0
     MAX_GENERATIONS = 200
     INITIAL_SEED = None
+    MAX_SEED = 2 ** 31 - 1
+    FITNESS_WORKERS = 1
+    FITNESS_CACHE_SIZE = 4096
     """
     Constantes image
     """
     IMAGE_WIDTH = 400
     IMAGE_HEIGHT = 500
+    SEGMENT_TOLERANCE = 1e-6
+    LOD_THRESHOLD = 1.
+    RENDER_CHUNK_SIZE = 1 << 14
+    FRAME_INTERVAL = 0.05
+    EXPORT_WIDTH = 4096
+    EXPORT_HEIGHT = 5120
+    EXPORT_BAND_HEIGHT = 256
     """
     Chemins
     """
-    IMAGE_SAVE_PATH = "C:/User/Ari/Desktop/lsystem.png"
+    IMAGE_SAVE_PATH = os.path.join(os.path.expanduser("~"), "lsystem.png")
     """
     Table d'équivalence
     """
@@ -6,9 +6,15 @@ from lib import *
 from parameters import LSystemParameters
 from turtle import Turtle, Renderer
 from app import LSystemApp
-from tree import Tree, Rule, Rules
+from tree import Rule, CompiledRules, Derivation, DerivationCache
 from db import Database, LsystemDAO
+from grammar import ContextRules
+from geometry import simplify
+from export import export_svg, export_png
+import raster
 
+from copy import copy
+from random import randint
 from queue import Queue
 import threading
 import time
@@ -47,12 +53,79 @@ class Controller:
                     self._controller.render_ga_image()
             self._status = Status.STOPPED
 
+    class RenderThread(threading.Thread):
+        """
+        Interprète et trace une forme par tronçons hors du fil graphique. Au plus une image partielle
+        est envoyée au panneau par Constant.FRAME_INTERVAL; seuls les nouveaux segments sont tracés,
+        sauf si les limites ont changé depuis l'image précédente. Passer status à STOPPED abandonne
+        le tracé au tronçon suivant et avant chaque envoi; les images portent render_generation, le
+        panneau ignorant celles d'un tracé déjà remplacé.
+        """
+        def __init__(self, controller: Controller, turtle: Turtle, bg_color: QColor, shape_color: QColor,
+                     render_generation: int):
+            super().__init__(daemon=True)
+            self._controller = controller
+            self._turtle = turtle
+            self._render_generation = render_generation
+            self._bg_color = bg_color
+            self._shape_color = shape_color
+            self._status: Status = Status.RUNNING
+
+        @property
+        def status(self) -> Status:
+            return self._status
+
+        @status.setter
+        def status(self, status: Status) -> None:
+            self._status = status
+
+        def run(self):
+            panel = self._controller._vue.simulation_panel
+            renderer, drawn_bounds, pending, last_frame = None, None, [], float("-inf")
+            try:
+                for segments in self._turtle.parse_chunks():
+                    if self._status == Status.STOPPED:
+                        return
+                    pending.append(segments)
+                    bounds = self._turtle.bounds
+                    if time.monotonic() - last_frame < Constant.FRAME_INTERVAL or not bounds.width \
+                            or not bounds.height:
+                        continue
+                    current_bounds = (bounds.min_x, bounds.max_x, bounds.min_y, bounds.max_y)
+                    if current_bounds != drawn_bounds:
+                        renderer = Renderer(bounds, self._turtle.segments, bg_color=self._bg_color,
+                                            shape_color=self._shape_color)
+                        drawn_bounds = current_bounds
+                    else:
+                        renderer.segments = np.concatenate(pending)
+                    pending.clear()
+                    if self._status == Status.STOPPED:
+                        return
+                    panel.frame_ready.emit(renderer.image.copy(), self._render_generation)
+                    last_frame = time.monotonic()
+                if self._status == Status.STOPPED:
+                    return
+                renderer = Renderer(self._turtle.bounds, Controller.visible_segments(self._turtle),
+                                    bg_color=self._bg_color, shape_color=self._shape_color)
+                if self._status == Status.STOPPED:
+                    return
+                panel.frame_ready.emit(renderer.image, self._render_generation)
+            except (ValueError, ZeroDivisionError) as e:
+                panel.render_failed.emit(f"{e}")
+            finally:
+                self._status = Status.STOPPED
+
     def __init__(self):
         self._lsystem_parameters: LSystemParameters = None
         self._ga_parameters: GeneticAlgorithmParameters = None
         self._ga = GeneticAlgorithm()
         self._turtle: Turtle = None
+        self._derivation_cache = DerivationCache()
+        self._render_thread: Controller.RenderThread = None
+        self._last_best: LSystem = None
+        self._seed: int = None
         self.default_lsystems = self.get_default_lsystems()
+        self._vue: LSystemApp = None
         self._vue = LSystemApp(self)
         self._update_queue = Queue()
         self._update_thread: Controller.UpdateThread = None
@@ -71,78 +144,170 @@ class Controller:
         self._ga_parameters = ga_parameters
         self._ga.parameters = ga_parameters
 
-    @property 
+    @property
+    def seed(self) -> int:
+        """
+        Graine du dernier rendu : tirée à chaque rendu si aucune n'est fixée, elle permet de le régénérer.
+        """
+        return self._seed
+
+    @property
     def lsystem_parameters(self) -> LSystemParameters:
         return self._lsystem_parameters
 
     @lsystem_parameters.setter
     def lsystem_parameters(self, parameters: LSystemParameters) -> None:
+        self.cancel_render()
         self._lsystem_parameters = parameters
 
     def get_default_lsystems(self) -> LsystemDAO:
         db = Database()
         return db.get_lsystems()
 
-    def generate_line_vector_from_params(self):
+    def generate_line_vector_from_params(self, parse: bool = True):
+        if "->" in self._lsystem_parameters.first_transformation_rule:
+            self.generate_line_vector_from_productions(parse)
+            return
         first_transformation_rule = Rule(self._lsystem_parameters.first_transformation_rule,
                                          self._lsystem_parameters.probability_one)
         second_transformation_rule = None
         if self.lsystem_parameters.second_transformation_rule.strip() != "":
             second_transformation_rule = Rule(self._lsystem_parameters.second_transformation_rule,
                                               self._lsystem_parameters.probability_two)
-        rules = Rules()
         iterations = self.lsystem_parameters.num_of_iterations
         axiom = self.lsystem_parameters.axiom
         angle = self.lsystem_parameters.angle
-        
-        rules.append(first_transformation_rule)
+        seed = self.lsystem_parameters.seed
+        if seed is None:
+            seed = randint(0, Constant.MAX_SEED)
+        self._seed = seed
+
+        transformation_rules = [first_transformation_rule]
         if second_transformation_rule:
-            rules.append(second_transformation_rule)
-        
-        transformed_value = Tree.transform(rules, iterations, axiom)
-        
-        tree = Tree(transformed_value)
-        
-        self._turtle = Turtle(tree, angle)
-        self._turtle.parse()
+            transformation_rules.append(second_transformation_rule)
+        rules = CompiledRules(transformation_rules)
+
+        symbols = Derivation(rules, iterations, axiom, seed)
+        if rules.is_predictable:
+            derived_length = rules.derived_length(axiom, symbols.iterations)
+            if derived_length > Constant.MAX_DERIVED_LENGTH:
+                raise ValueError(f"Chaîne dérivée trop longue : {derived_length} symboles")
+        if not symbols.is_instanceable and symbols.iterations <= Constant.MAX_ITERATIONS \
+                and (rules.is_deterministic or seed is not None):
+            codes = self._derivation_cache.transform_codes(rules, symbols.iterations, axiom, seed,
+                                                           self._derivation_cache.memory_budget)
+            if codes is not None:
+                symbols = codes
+
+        self._turtle = Turtle(symbols, angle, with_hierarchy=True)
+        if parse:
+            self._turtle.parse()
+
+    def generate_line_vector_from_productions(self, parse: bool = True):
+        """
+        Règles notées "gauche < prédécesseur > droite : condition -> successeur" : dérivation
+        sensible au contexte ou paramétrique, les rotations étant transparentes pour les contextes.
+        """
+        productions = [self._lsystem_parameters.first_transformation_rule]
+        if self._lsystem_parameters.second_transformation_rule.strip() != "":
+            productions.append(self._lsystem_parameters.second_transformation_rule)
+        if self.lsystem_parameters.num_of_iterations > Constant.MAX_ITERATIONS:
+            raise ValueError(f"Au plus {Constant.MAX_ITERATIONS} itérations avec des règles contextuelles")
+        rules = ContextRules(productions, ignore=Constant.CONTEXT_IGNORE)
+        modules = rules.transform(self.lsystem_parameters.axiom, self.lsystem_parameters.num_of_iterations)
+
+        self._turtle = Turtle(iter(modules), self.lsystem_parameters.angle, with_hierarchy=True)
+        if parse:
+            self._turtle.parse()
+
+    @staticmethod
+    def visible_segments(turtle: Turtle) -> np.ndarray:
+        """
+        Segments réellement visibles à la taille de l'image : niveau de détail selon la hiérarchie
+        des branches, puis retrait des doublons.
+        """
+        viewport, pixel_size = raster.viewport(turtle.bounds, Constant.IMAGE_WIDTH, Constant.IMAGE_HEIGHT)
+        return simplify(turtle.hierarchy.level_of_detail(viewport, pixel_size)).segments
 
     @Slot()
     def render_image(self):
-        self.generate_line_vector_from_params()
-        
+        """
+        En mode progressif, seule la dérivation se fait ici; l'interprétation et le tracé sont
+        confiés à un RenderThread.
+        """
+        self.cancel_render()
+        self.generate_line_vector_from_params(parse=not self.lsystem_parameters.progressive)
+        if self.lsystem_parameters.progressive:
+            self._turtle.chunk_size = Constant.RENDER_CHUNK_SIZE
+            self._render_thread = Controller.RenderThread(self, self._turtle, self.lsystem_parameters.bg_color,
+                                                          self.lsystem_parameters.shape_color,
+                                                          self._vue.simulation_panel.render_generation)
+            self._render_thread.start()
+            return
+
         bg_color = self.lsystem_parameters.bg_color
         shape_color = self.lsystem_parameters.shape_color
-        renderer = Renderer(self._turtle.bounds, self._turtle.line_vector, bg_color=bg_color, shape_color=shape_color)
+        segments = Controller.visible_segments(self._turtle)
+        renderer = Renderer(self._turtle.bounds, segments, bg_color=bg_color, shape_color=shape_color)
         
-        self._vue.simulation_panel.update(renderer.pixmap)
+        self._vue.simulation_panel.update(renderer.image)
+
+    def cancel_render(self) -> None:
+        if self._render_thread and self._render_thread.status == Status.RUNNING:
+            self._render_thread.status = Status.STOPPED
+        self._render_thread = None
+        if self._vue:
+            self._vue.simulation_panel.next_render_generation()
 
     @Slot()
     def render_ga_image(self):
+        """
+        Appelée par UpdateThread : l'image est tracée dans ce fil et seul son affichage est confié
+        au fil graphique.
+        """
         self._ga.run()
         best = self._ga.best
         worst = self._ga.worst
+        self._last_best = copy(best)
 
-        best_turtle = Turtle(best.tree, best.angle)
+        best_turtle = Turtle(best.tree, best.angle, with_hierarchy=True)
         best_turtle.parse()
 
-        worst_turtle = Turtle(worst.tree, worst.angle)
+        worst_turtle = Turtle(worst.tree, worst.angle, with_hierarchy=True)
         worst_turtle.parse()
 
-        renderer = Renderer(best_turtle.bounds, best_turtle.line_vector)
-        renderer.line_vector = worst_turtle.line_vector
+        best_segments = Controller.visible_segments(best_turtle)
+        renderer = Renderer(best_turtle.bounds, best_segments)
+        renderer.segments = Controller.visible_segments(worst_turtle)
         renderer.shape_color = QColor(0, 0, 255)
         renderer.bounds = worst_turtle.bounds
         renderer._render()
 
-        renderer.line_vector = best_turtle.line_vector
+        renderer.segments = best_segments
         renderer.shape_color = QColor(0, 0, 0)
         renderer.bounds = best_turtle.bounds
-        self._vue.simulation_panel.update(renderer.pixmap)
+        self._vue.simulation_panel.image_ready.emit(renderer.image)
 
-    @Slot()
-    def save_ga_image(self) -> bool:
-        if not self._update_thread:
-            return self._vue.simulation_panel.simulation_image.save(Constant.IMAGE_SAVE_PATH, "PNG", 100)
+    def save_ga_image(self, path: str = Constant.IMAGE_SAVE_PATH, width: int = Constant.EXPORT_WIDTH,
+                      height: int = Constant.EXPORT_HEIGHT) -> bool:
+        """
+        Exporte le dernier meilleur individu affiché en SVG ou en PNG selon l'extension de path, en
+        flux depuis la tortue : la résolution n'est limitée ni par la mémoire ni par la taille du
+        panneau. Une copie en est gardée à chaque génération, l'arrêt de la simulation réinitialisant
+        l'algorithme génétique.
+        """
+        if self._update_thread and self._update_thread.status == Status.RUNNING or self._last_best is None:
+            return False
+        best = self._last_best
+        turtle = Turtle(best.tree, best.angle, statistics_only=True)
+        try:
+            if path.lower().endswith(".svg"):
+                export_svg(turtle, path, width, height)
+            else:
+                export_png(turtle, path, width, height)
+        except (OSError, ValueError, ZeroDivisionError):
+            return False
+        return True
 
     @Slot()
     def start_simulation(self) -> None:
@@ -0,0 +1,85 @@
+from typing import List, Mapping, Iterable, Optional
+
+import numpy as np
+
+from constant import Constant
+
+"""
+Codage des chaînes de systèmes L en tableaux NumPy uint8 selon Constant.SYMBOL_CODES : un octet par
+symbole, comparaisons et réécritures vectorisées.
+"""
+_ascii_to_code = np.full(256, 255, dtype=np.uint8)
+for _symbol, _code in Constant.SYMBOL_CODES.items():
+    _ascii_to_code[ord(_symbol)] = _code
+_code_to_ascii = np.frombuffer("".join(Constant.SYMBOLS).encode("ascii"), dtype=np.uint8)
+
+
+def encode(value: str) -> np.ndarray:
+    try:
+        codes = _ascii_to_code[np.frombuffer(value.encode("ascii"), dtype=np.uint8)]
+    except UnicodeEncodeError:
+        raise ValueError("Caractère inconnu. Le caractère doit faire partie de l'alphabet")
+    if codes.size and codes.max() == 255:
+        raise ValueError("Caractère inconnu. Le caractère doit faire partie de l'alphabet")
+    return codes
+
+
+def decode(codes: np.ndarray) -> str:
+    return _code_to_ascii[codes].tobytes().decode("ascii")
+
+
+def code(symbol: str) -> int:
+    return Constant.SYMBOL_CODES[symbol]
+
+
+class ProductionTable:
+    """
+    Productions codées d'un ensemble de règles à prédécesseurs d'un seul symbole. Toutes les
+    productions, identité comprise pour les symboles sans règle, sont concaténées dans un seul
+    tableau; chaque variante (une seule si déterministe, une par règle sinon) indique pour chaque
+    symbole le décalage et la longueur de sa production. Une étape de dérivation se réduit alors
+    à une indexation vectorisée par rang dans la production, la plus longue production bornant
+    le nombre de passes.
+    """
+    def __init__(self, variants: List[Mapping[str, str]], predecessors: Iterable[str]):
+        table = []
+        self._offsets = np.zeros((len(variants), len(Constant.SYMBOLS)), dtype=np.intp)
+        self._lengths = np.zeros((len(variants), len(Constant.SYMBOLS)), dtype=np.intp)
+        for variant, productions in enumerate(variants):
+            for symbol_code, symbol in enumerate(Constant.SYMBOLS):
+                production = encode(productions.get(symbol, symbol))
+                self._offsets[variant, symbol_code] = len(table)
+                self._lengths[variant, symbol_code] = len(production)
+                table.extend(production.tolist())
+        self._table = np.array(table, dtype=np.uint8)
+        self._max_length = int(self._lengths.max())
+        self._is_predecessor = np.zeros(len(Constant.SYMBOLS), dtype=bool)
+        for predecessor in predecessors:
+            self._is_predecessor[code(predecessor)] = True
+
+    @property
+    def is_stochastic(self) -> bool:
+        return len(self._offsets) > 1
+
+    def predecessor_mask(self, codes: np.ndarray) -> np.ndarray:
+        return self._is_predecessor[codes]
+
+    def step(self, codes: np.ndarray, variants: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Réécrit chaque symbole selon sa variante (la première par défaut) en une seule passe.
+        """
+        if variants is None:
+            offsets = self._offsets[0][codes]
+            lengths = self._lengths[0][codes]
+        else:
+            offsets = self._offsets[variants, codes]
+            lengths = self._lengths[variants, codes]
+        ends = np.cumsum(lengths)
+        if not ends.size:
+            return codes
+        starts = ends - lengths
+        derived = np.empty(ends[-1], dtype=np.uint8)
+        for rank in range(self._max_length):
+            present = lengths > rank
+            derived[starts[present] + rank] = self._table[offsets[present] + rank]
+        return derived
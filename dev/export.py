@@ -0,0 +1,168 @@
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from typing import TextIO
+
+import numpy as np
+
+import raster
+from constant import Constant
+from geometry import Turtle, simplify
+from raster import Color
+
+"""
+Exportation en flux vers SVG ou PNG à résolution arbitraire. La tortue est interprétée tronçon par
+tronçon : ni l'ensemble des segments sous forme d'objets, ni l'image complète ne sont gardés en
+mémoire.
+"""
+
+
+class PNGWriter:
+    """
+    Écriture d'un PNG RGBA bande par bande, les rangées étant compressées au fur et à mesure.
+    """
+    _signature = b"\x89PNG\r\n\x1a\n"
+
+    def __init__(self, path: str, width: int, height: int):
+        self._path = path
+        self._width = width
+        self._height = height
+        self._rows: int = 0
+        self._compressor = zlib.compressobj(6)
+        self._file = open(path, "wb")
+        self._file.write(PNGWriter._signature)
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+
+    def _chunk(self, kind: bytes, data: bytes) -> None:
+        self._file.write(struct.pack(">I", len(data)) + kind + data
+                         + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    def write(self, rows: np.ndarray) -> None:
+        """
+        Ajoute des rangées (hauteur, largeur, 4) en uint8, sans filtre.
+        """
+        if rows.shape[1:] != (self._width, 4):
+            raise ValueError("Rangées de dimensions invalides")
+        filtered = np.zeros((len(rows), 4 * self._width + 1), dtype=np.uint8)
+        filtered[:, 1:] = rows.reshape(len(rows), -1)
+        data = self._compressor.compress(filtered.tobytes())
+        if data:
+            self._chunk(b"IDAT", data)
+        self._rows += len(rows)
+
+    def close(self) -> None:
+        """
+        Termine le fichier. Un fichier incomplet est supprimé avant de lever l'erreur.
+        """
+        if self._rows != self._height:
+            self.abort()
+            raise ValueError("Nombre de rangées invalide")
+        try:
+            self._chunk(b"IDAT", self._compressor.flush())
+            self._chunk(b"IEND", b"")
+        finally:
+            self._file.close()
+
+    def abort(self) -> None:
+        """
+        Ferme le fichier sans le terminer et le supprime.
+        """
+        self._file.close()
+        os.remove(self._path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        if exception_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def _write_polylines(out: TextIO, segments: np.ndarray) -> None:
+    polylines = simplify(segments)
+    coordinates = [f"{x:.3f},{y:.3f}" for x, y in polylines.vertices.tolist()]
+    for start, end in zip(polylines.offsets[:-1].tolist(), polylines.offsets[1:].tolist()):
+        out.write(f'<path d="M{coordinates[start]}L{" ".join(coordinates[start + 1:end])}"/>\n')
+
+
+def export_svg(turtle: Turtle, path: str, width: int = Constant.EXPORT_WIDTH, height: int = Constant.EXPORT_HEIGHT,
+               bg_color: Color = (255, 255, 255, 255), shape_color: Color = (0, 0, 0, 255)) -> None:
+    """
+    Les polylignes de chaque tronçon sont écrites dans un fichier temporaire; l'en-tête, qui a
+    besoin des limites, n'est écrit qu'à la fin de l'interprétation.
+    """
+    with tempfile.TemporaryFile("w+", encoding="ascii") as body:
+        for segments in turtle.parse_chunks():
+            if len(segments):
+                _write_polylines(body, segments)
+        bounds = turtle.bounds
+        body.seek(0)
+        with open(path, "w", encoding="ascii") as out:
+            out.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+                      f'viewBox="{bounds.min_x:.3f} {bounds.min_y:.3f} {bounds.width:.3f} {bounds.height:.3f}">\n')
+            out.write(f'<rect x="{bounds.min_x:.3f}" y="{bounds.min_y:.3f}" width="100%" height="100%" '
+                      f'fill="rgb{tuple(bg_color[:3])}" fill-opacity="{bg_color[3] / 255:g}"/>\n')
+            out.write(f'<g fill="none" stroke="rgb{tuple(shape_color[:3])}" stroke-opacity="{shape_color[3] / 255:g}" '
+                      f'stroke-width="1" vector-effect="non-scaling-stroke">\n')
+            shutil.copyfileobj(body, out)
+            out.write("</g>\n</svg>\n")
+
+
+def export_png(turtle: Turtle, path: str, width: int = Constant.EXPORT_WIDTH, height: int = Constant.EXPORT_HEIGHT,
+               bg_color: Color = (255, 255, 255, 255), shape_color: Color = (0, 0, 0, 255),
+               antialias: bool = False, band_height: int = Constant.EXPORT_BAND_HEIGHT,
+               block_size: int = 1 << 20) -> None:
+    """
+    Une première passe interprète la tortue et range ses segments en float32 dans un fichier
+    temporaire. Une seconde les relit par blocs de block_size et range chacun, dans un autre
+    fichier, avec chaque bande de band_height rangées qu'il croise : les segments d'un bloc y
+    sont écrits triés par bande et seule la position de chaque série est gardée en mémoire.
+    L'image est enfin tramée bande par bande à partir de ses seules séries.
+    """
+    spool = tempfile.NamedTemporaryFile(suffix=".segments", delete=False)
+    try:
+        with spool:
+            for segments in turtle.parse_chunks():
+                segments.astype(np.float32).tofile(spool)
+        count = os.path.getsize(spool.name) // 16
+        stored = np.memmap(spool.name, dtype=np.float32, mode="r", shape=(count, 4)) if count else np.empty((0, 4))
+        band_count = -(-height // band_height)
+        with tempfile.TemporaryFile() as buckets:
+            runs = [[] for _ in range(band_count)]
+            for start in range(0, count, block_size):
+                block = np.asarray(stored[start:start + block_size])
+                projected = raster.project(block.astype(float), turtle.bounds, width, height)
+                low = np.minimum(projected[:, 1], projected[:, 3])
+                high = np.maximum(projected[:, 1], projected[:, 3])
+                first = np.maximum(np.floor_divide(low - 1, band_height), 0).astype(np.intp)
+                last = np.minimum(np.floor_divide(high + 1, band_height), band_count - 1).astype(np.intp)
+                spans = np.maximum(last - first + 1, 0)
+                bands = np.repeat(first, spans) + np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans)
+                order = np.argsort(bands, kind="stable")
+                sizes = np.bincount(bands, minlength=band_count)
+                offset = buckets.tell()
+                block[np.repeat(np.arange(len(block)), spans)[order]].tofile(buckets)
+                for band, size in enumerate(sizes.tolist()):
+                    if size:
+                        runs[band].append((offset, size))
+                        offset += 16 * size
+            del stored
+            with PNGWriter(path, width, height) as writer:
+                for band, top in enumerate(range(0, height, band_height)):
+                    rows = min(band_height, height - top)
+                    covered = np.zeros((rows, width), dtype=np.float32)
+                    for offset, size in runs[band]:
+                        buckets.seek(offset)
+                        segments = np.fromfile(buckets, dtype=np.float32, count=4 * size).reshape(size, 4)
+                        segments = raster.project(segments.astype(float), turtle.bounds, width, height)
+                        segments[:, [1, 3]] -= top
+                        np.maximum(covered, raster.coverage(segments, width, rows, antialias), out=covered)
+                    band_buffer = raster.new_buffer(width, rows, bg_color)
+                    raster.blend(band_buffer, covered, shape_color)
+                    writer.write(band_buffer)
+    finally:
+        os.remove(spool.name)
@@ -1,18 +1,119 @@
+from __future__ import annotations
+
 from random import uniform, choice
 from statistics import mean
 from math import floor
-from copy import deepcopy
+from copy import copy
+from hashlib import blake2b
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
 import numpy as np
 import re
+from abc import ABC, abstractmethod
+from typing import List, Tuple, Any
 
-from util import cosine_law, Bounds, sigmoid, to_upper
-from turtle import Turtle, Renderer
+from util import cosine_law, Bounds, sigmoid, to_upper, LRUCache
+from geometry import Turtle
 from lsystem import LSystemFactory, LSystem
 from geneticsetup import *
-from lib import *
 from constant import Constant
 
 
+class PopulationGeometry:
+    """
+    Géométrie de toute une population en tableau irrégulier de morceaux : nombre de points, somme
+    de leurs coordonnées et boîte (coin inférieur, coin supérieur) de chaque morceau, ceux du k-ième
+    individu étant les morceaux offsets[k]:offsets[k + 1]. Un morceau peut être un point isolé ou
+    les agrégats d'une sous-arborescence entière. Chaque individu compte au moins son point de
+    départ, l'origine; aucun intervalle n'est donc vide et les agrégats de chaque individu (sommes,
+    limites, centroïde) sont obtenus par une seule réduction par segment (reduceat) pour toute la
+    population.
+    """
+    def __init__(self, counts: np.ndarray, sums: np.ndarray, lower: np.ndarray, upper: np.ndarray,
+                 offsets: np.ndarray, branch_counts: np.ndarray):
+        if len(offsets) < 2:
+            raise ValueError("Population vide")
+        self._offsets = offsets
+        self._branch_counts = branch_counts
+        starts = offsets[:-1]
+        self._counts = np.add.reduceat(counts, starts)
+        self._sums = np.add.reduceat(sums, starts)
+        self._minimums = np.minimum.reduceat(lower, starts)
+        self._maximums = np.maximum.reduceat(upper, starts)
+
+    @staticmethod
+    def from_points(points: np.ndarray, offsets: np.ndarray, branch_counts: np.ndarray) -> PopulationGeometry:
+        return PopulationGeometry(np.ones(len(points)), points, points, points, offsets, branch_counts)
+
+    @staticmethod
+    def of(population: List[Any]) -> PopulationGeometry:
+        """
+        Un morceau pour l'origine et un pour l'ensemble des segments de chaque individu, lus dans
+        une tortue en mode statistiques : seules les sous-arborescences modifiées depuis la
+        génération précédente sont recombinées, l'angle n'étant appliqué qu'ensuite (voir
+        geometry.node_contribution). Le mode statistiques est indispensable : sans lui, chaque
+        individu matérialise à nouveau tous ses segments.
+        """
+        counts, sums, lower, upper, offsets, branch_counts = [], [], [], [], [0], []
+        for lsystem in population:
+            turtle = Turtle(lsystem.tree, lsystem.angle, statistics_only=True, integer_heading=True)
+            turtle.parse()
+            counts.append(1.)
+            sums.append((0., 0.))
+            lower.append((0., 0.))
+            upper.append((0., 0.))
+            if turtle.segment_count:
+                bounds = turtle.bounds
+                counts.append(turtle.segment_count)
+                sums.append((turtle.x_sum, turtle.y_sum))
+                lower.append((bounds.min_x, bounds.min_y))
+                upper.append((bounds.max_x, bounds.max_y))
+            offsets.append(len(counts))
+            branch_counts.append(turtle.branch_count)
+        return PopulationGeometry(np.array(counts), np.array(sums), np.array(lower), np.array(upper),
+                                  np.array(offsets, dtype=np.intp), np.array(branch_counts, dtype=float))
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    @property
+    def offsets(self) -> np.ndarray:
+        return self._offsets
+
+    @property
+    def branch_counts(self) -> np.ndarray:
+        return self._branch_counts
+
+    @property
+    def x_sums(self) -> np.ndarray:
+        return self._sums[:, 0]
+
+    @property
+    def centroid_x(self) -> np.ndarray:
+        return self._sums[:, 0] / self._counts
+
+    @property
+    def centroid_y(self) -> np.ndarray:
+        return self._sums[:, 1] / self._counts
+
+    @property
+    def min_x(self) -> np.ndarray:
+        return self._minimums[:, 0]
+
+    @property
+    def min_y(self) -> np.ndarray:
+        return self._minimums[:, 1]
+
+    @property
+    def max_x(self) -> np.ndarray:
+        return self._maximums[:, 0]
+
+    @property
+    def widths(self) -> np.ndarray:
+        return self._maximums[:, 0] - self._minimums[:, 0]
+
+
 class FitnessStrategy(ABC):
     def __repr__(self):
         """
@@ -29,10 +130,26 @@ class FitnessStrategy(ABC):
     def evaluate(self):
         raise NotImplementedError()
 
+    @abstractmethod
+    def evaluate_batch(self, geometry: PopulationGeometry, population: List[Any]) -> np.ndarray:
+        """
+        Fitness de chaque individu de la population, calculée sur les agrégats de geometry.
+        """
+        raise NotImplementedError()
+
+    def accumulate(self, fitness: np.ndarray) -> None:
+        """
+        Met à jour l'état de la stratégie à partir des valeurs d'une génération évaluées par une
+        copie, dans un autre processus. Sans effet pour une stratégie sans état.
+        """
+
 
 class SymmetryFitness(FitnessStrategy):
     def evaluate(self, turtle: Turtle, lsystem: LSystem) -> float:
-        return 1.0 - (abs(turtle.centroid.x() - turtle.bounds.x_center) / (turtle.bounds.width + 1e-10))
+        return 1.0 - (abs(turtle.centroid.x - turtle.bounds.x_center) / (turtle.bounds.width + 1e-10))
+
+    def evaluate_batch(self, geometry: PopulationGeometry, population: List[Any]) -> np.ndarray:
+        return 1.0 - (np.abs(geometry.centroid_x - geometry.widths / 2) / (geometry.widths + 1e-10))
 
 
 class CumulativeSymmetryFitness(FitnessStrategy):
@@ -42,7 +159,7 @@ class CumulativeSymmetryFitness(FitnessStrategy):
     sigmoïde : plus l'arbre est débalancé, plus le résultat tendra vers 1.
     """
     def evaluate(self, turtle: Turtle, lsystem: LSystem) -> float:
-        x_coordinates_sum = abs(sum(point.x() for point in turtle.point_vector))
+        x_coordinates_sum = abs(turtle.x_sum)
         try:
             result = 1 - sigmoid(x_coordinates_sum)
         except OverflowError:
@@ -50,6 +167,9 @@ class CumulativeSymmetryFitness(FitnessStrategy):
         finally:
             return result
 
+    def evaluate_batch(self, geometry: PopulationGeometry, population: List[Any]) -> np.ndarray:
+        return 1 - 1 / (1 + np.exp(-np.abs(geometry.x_sums)))
+
 
 class BranchFitness(FitnessStrategy):
     def __init__(self):
@@ -60,16 +180,24 @@ class BranchFitness(FitnessStrategy):
         return self._max_branch_count
     
     def evaluate(self, turtle: Turtle, lsystem: LSystem):
-        branch_count = lsystem.value.count("]")
+        branch_count = turtle.branch_count
         self._max_branch_count = max(branch_count, self._max_branch_count)
         return branch_count
 
+    def evaluate_batch(self, geometry: PopulationGeometry, population: List[Any]) -> np.ndarray:
+        self.accumulate(geometry.branch_counts)
+        return geometry.branch_counts
+
+    def accumulate(self, fitness: np.ndarray) -> None:
+        if len(fitness):
+            self._max_branch_count = max(int(fitness.max()), self._max_branch_count)
+
 
 class CanopyFitness(FitnessStrategy):
     def evaluate(self, turtle: Turtle, lsystem: LSystem) -> float:
         a = ((turtle.bounds.min_x - turtle.bounds.max_x) ** 2) ** 0.5
-        b = (turtle.bounds.min_x ** 2 + (turtle.bounds.min_y - turtle.centroid.y()) ** 2) ** 0.5
-        c = ((turtle.bounds.min_x - turtle.bounds.max_x) ** 2 + (turtle.centroid.y() - turtle.bounds.min_y) ** 2) ** 0.5
+        b = (turtle.bounds.min_x ** 2 + (turtle.bounds.min_y - turtle.centroid.y) ** 2) ** 0.5
+        c = ((turtle.bounds.min_x - turtle.bounds.max_x) ** 2 + (turtle.centroid.y - turtle.bounds.min_y) ** 2) ** 0.5
 
         if a * b * c:
             alpha, beta, gamma = cosine_law(a, b, c) 
@@ -79,6 +207,20 @@ class CanopyFitness(FitnessStrategy):
 
         return 1.0 - mean_angle / 90.0
 
+    def evaluate_batch(self, geometry: PopulationGeometry, population: List[Any]) -> np.ndarray:
+        """
+        Loi des cosinus vectorisée; les cosinus sont bornés à [-1, 1] pour les triangles dégénérés.
+        """
+        a = geometry.widths
+        b = (geometry.min_x ** 2 + (geometry.min_y - geometry.centroid_y) ** 2) ** 0.5
+        c = (geometry.widths ** 2 + (geometry.centroid_y - geometry.min_y) ** 2) ** 0.5
+        defined = (a * b * c) != 0
+        a, b, c = np.where(defined, a, 1.), np.where(defined, b, 1.), np.where(defined, c, 1.)
+        beta = np.degrees(np.arccos(np.clip((a ** 2 + c ** 2 - b ** 2) / (2 * a * c), -1., 1.)))
+        gamma = np.degrees(np.arccos(np.clip((b ** 2 + a ** 2 - c ** 2) / (2 * a * b), -1., 1.)))
+        mean_angle = np.where(defined, (beta + gamma) / 2, 90.)
+        return 1.0 - mean_angle / 90.0
+
 
 class HeightFitness(FitnessStrategy):
     def __init__(self):
@@ -92,6 +234,14 @@ class HeightFitness(FitnessStrategy):
         self._max_tree_height = min(self._max_tree_height, turtle.bounds.min_y)
         return turtle.bounds.min_y
 
+    def evaluate_batch(self, geometry: PopulationGeometry, population: List[Any]) -> np.ndarray:
+        self.accumulate(geometry.min_y)
+        return geometry.min_y
+
+    def accumulate(self, fitness: np.ndarray) -> None:
+        if len(fitness):
+            self._max_tree_height = min(self._max_tree_height, float(fitness.min()))
+
 
 class SelectionStrategy(ABC):
     def __init__(self):
@@ -102,21 +252,18 @@ class SelectionStrategy(ABC):
         raise NotImplementedError()
 
     def select(self, population: List[Any], number_of_parents: int) -> List[Any]:
-        population = deepcopy(population)
-        parents = []
-        for i in range(number_of_parents):
-            parent_to_add = choices(population, self._population_fitness_weights, k=1)[0]
-            for parent in parents:
-                if parent_to_add is parent:
-                    parent_to_add = deepcopy(parent_to_add)
-            parents.append(parent_to_add)
-        return parents
+        """
+        Les géniteurs sont des copies partageant l'arbre de l'individu choisi; la population n'est
+        donc jamais modifiée par le croisement, même si un individu est choisi plus d'une fois.
+        """
+        return [copy(parent) for parent in choices(population, self._population_fitness_weights, k=number_of_parents)]
 
 
 class RouletteWheelStrategy(SelectionStrategy):
     """
-    Selection de geniteurs. Utilisation d'une boucle afin d'éviter que le même objet
-    ne se retrouve deux fois dans la liste retournée.
+    Selection de geniteurs proportionnelle à la fitness. Chaque géniteur retourné est une copie
+    distincte, même si le même individu est tiré plusieurs fois; ces copies partagent l'arbre de
+    l'individu, qui n'est copié que le long des chemins modifiés par croisement ou mutation.
     """
     def calculate_weights(self, population_fitness: np.array, generation_count: int = None) -> None:
         mean_fitness = np.mean(population_fitness)
@@ -181,20 +328,26 @@ class NodeCrossoverStrategy(CrossoverStrategy):
     """
     Les enfants de deux nodes sont échangés, générant deux enfants de la prochaine génération. 
     La méthode pourrait être éventuellement modifiée afin de ne générer qu'un seul descendant au lieu
-    de deux.
+    de deux. Seul le chemin menant à chaque node échangée est copié, le reste de l'arbre restant
+    partagé avec le géniteur.
     """
     def crossover(self, first_parent: LSystem, second_parent: LSystem, angle_crossover: bool = True) -> Tuple[LSystem]:
-        first_subtree = choice([node for node in Traversal.node_generator(first_parent.tree.root)]) 
-        second_subtree = choice([node for node in Traversal.node_generator(second_parent.tree.root)])
+        _, first_indices = choice([node for node in Traversal.node_path_generator(first_parent.tree.root)])
+        _, second_indices = choice([node for node in Traversal.node_path_generator(second_parent.tree.root)])
+
+        first_path = first_parent.tree.copy_path(first_indices)
+        second_path = second_parent.tree.copy_path(second_indices)
+        first_subtree, second_subtree = first_path[-1], second_path[-1]
 
         first_cut_off_index = randint(0, len(first_subtree.child) - 1)
         second_cut_off_index = randint(0, len(second_subtree.child) - 1)
 
-        first_cut_off = first_subtree.child.pop(first_cut_off_index)
-        second_cut_off = second_subtree.child.pop(second_cut_off_index)
+        first_cut_off = first_subtree.child[first_cut_off_index]
+        first_subtree.child[first_cut_off_index] = second_subtree.child[second_cut_off_index]
+        second_subtree.child[second_cut_off_index] = first_cut_off
 
-        first_subtree.child.insert(first_cut_off_index, second_cut_off)
-        second_subtree.child.insert(second_cut_off_index, first_cut_off)
+        for node in (*first_path, *second_path):
+            node.invalidate()
 
         if angle_crossover:
             angle_crossover = AngleCrossover()
@@ -203,16 +356,56 @@ class NodeCrossoverStrategy(CrossoverStrategy):
         return first_parent, second_parent
 
 
+class FitnessCache:
+    """
+    Fitness brutes des individus déjà évalués, une colonne par individu, gardées dans un LRUCache.
+    La clé est une empreinte canonique du génome, l'angle et les stratégies actives : les poids
+    et la normalisation s'appliquent après lecture et n'en font donc pas partie.
+    """
+    def __init__(self, capacity: int = Constant.FITNESS_CACHE_SIZE):
+        self._cache = LRUCache(capacity)
+
+    @property
+    def hits(self) -> int:
+        return self._cache.hits
+
+    @property
+    def misses(self) -> int:
+        return self._cache.misses
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    @staticmethod
+    def key(lsystem: LSystem, fitness_strategies: List[FitnessStrategy]) -> Tuple:
+        return (blake2b(lsystem.value.encode("ascii"), digest_size=16).digest(), float(lsystem.angle),
+                tuple(type(fitness_strategy).__qualname__ for fitness_strategy in fitness_strategies))
+
+    def get(self, key: Tuple) -> np.ndarray:
+        return self._cache.get(key)
+
+    def put(self, key: Tuple, fitness: np.ndarray) -> None:
+        fitness = fitness.copy()
+        fitness.flags.writeable = False
+        self._cache.put(key, fitness)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
 class CumulativeFitness:
     """
     Classe permettant de ne retourner que la fitness cumulative d'une population donnée 
     en vue de son utilisation par l'algorithme génétique.
     """
-    def __init__(self, population: List[Any], fitness_strategies: List[FitnessStrategy], fitness_weights: List[float]):
+    def __init__(self, population: List[Any], fitness_strategies: List[FitnessStrategy], fitness_weights: List[float],
+                 workers: int = Constant.FITNESS_WORKERS, fitness_cache: FitnessCache = None):
         self._fitness_strategies = fitness_strategies
         self._population = population
         self._fitness_weights = np.array(fitness_weights).reshape((len(fitness_weights), 1))
         self._cumulative_fitness: np.array = None
+        self._workers = workers
+        self._fitness_cache = fitness_cache
 
     @property
     def cumulative_fitness(self) -> np.array:
@@ -226,25 +419,136 @@ class CumulativeFitness:
     def fitness_weights(self, fitness_weights: List[float]) -> None:
         self._fitness_weights = fitness_weights
 
+    @property
+    def workers(self) -> int:
+        return self._workers
+
+    @workers.setter
+    def workers(self, workers: int) -> None:
+        self._workers = workers
+
+    @property
+    def fitness_cache(self) -> FitnessCache:
+        return self._fitness_cache
+
     @abstractmethod
     def compute_fitness(self) -> float:
         raise NotImplementedError()
 
 
+def evaluate_population(population: List[Any], fitness_strategies: List[FitnessStrategy]) -> np.ndarray:
+    """
+    Matrice (stratégies, individus) des fitness brutes, une ligne par stratégie calculée d'un
+    seul coup sur la PopulationGeometry. Fonction de module afin d'être exécutée telle quelle par
+    les processus de LSystemCumulativeFitness.
+    """
+    fitness_array = np.zeros((len(fitness_strategies), len(population)))
+    if not population:
+        return fitness_array
+    geometry = PopulationGeometry.of(population)
+    for j, fitness_strategy in enumerate(fitness_strategies):
+        fitness_array[j] = fitness_strategy.evaluate_batch(geometry, population)
+    return fitness_array
+
+
+def evaluate_chunk(population: List[Any], fitness_strategies: List[FitnessStrategy]) -> Tuple[np.ndarray, List[list]]:
+    """
+    evaluate_population exécutée par un processus de LSystemCumulativeFitness. Retourne aussi,
+    pour chaque individu et en préordre, la contribution de chaque node qui n'en avait pas encore
+    (None pour les autres), afin que le processus principal la conserve pour les générations
+    suivantes plutôt que de la recalculer.
+    """
+    known = [[node.contribution is not None for node in Traversal.preorder(lsystem.tree.root)]
+             for lsystem in population]
+    fitness_array = evaluate_population(population, fitness_strategies)
+    contributions = [[None if is_known else node.contribution
+                      for node, is_known in zip(Traversal.preorder(lsystem.tree.root), lsystem_known)]
+                     for lsystem, lsystem_known in zip(population, known)]
+    return fitness_array, contributions
+
+
 class LSystemCumulativeFitness(CumulativeFitness):
     """
     Classe permettant de calculer la fitness cumulative des Systemes de Lindenmayer.
     Une troisieme boucle est necessaire afin de normaliser les fitness de hauteur 
     et de branches en les divisant par les plus grandes mesures.
+
+    Avec plus d'un worker, la population est découpée en un tronçon par processus d'un pool
+    persistant, partagé par toutes les instances. Les stratégies y sont évaluées sur des copies,
+    leur état étant ensuite mis à jour par accumulate : les valeurs sont identiques bit à bit à
+    celles d'une évaluation en série, vers laquelle on se replie si le pool est inutilisable. Les
+    contributions calculées par les processus sont rapatriées dans les nodes (voir evaluate_chunk).
     """
-    def compute_fitness(self) -> np.array:
+    _executor: ProcessPoolExecutor = None
+    _executor_workers: int = 0
+
+    @staticmethod
+    def executor(workers: int) -> ProcessPoolExecutor:
+        if LSystemCumulativeFitness._executor_workers != workers:
+            if LSystemCumulativeFitness._executor:
+                LSystemCumulativeFitness._executor.shutdown(wait=False, cancel_futures=True)
+            LSystemCumulativeFitness._executor = ProcessPoolExecutor(workers, multiprocessing.get_context("spawn"))
+            LSystemCumulativeFitness._executor_workers = workers
+        return LSystemCumulativeFitness._executor
+
+    def _evaluate_parallel(self, population: List[Any]) -> np.ndarray:
+        chunks = [chunk.tolist() for chunk in np.array_split(np.arange(len(population)), self._workers)
+                  if len(chunk)]
+        executor = LSystemCumulativeFitness.executor(self._workers)
+        futures = [executor.submit(evaluate_chunk, [population[i] for i in chunk],
+                                   self._fitness_strategies) for chunk in chunks]
+        results = [future.result() for future in futures]
+        for chunk, (_, contributions) in zip(chunks, results):
+            for i, lsystem_contributions in zip(chunk, contributions):
+                for node, contribution in zip(Traversal.preorder(population[i].tree.root), lsystem_contributions):
+                    if contribution is not None:
+                        node.contribution = contribution
+        fitness_array = np.concatenate([fitness for fitness, _ in results], axis=1)
+        for j, fitness_strategy in enumerate(self._fitness_strategies):
+            fitness_strategy.accumulate(fitness_array[j])
+        return fitness_array
+
+    def _evaluate(self, population: List[Any]) -> np.ndarray:
+        if self._workers > 1 and len(population) > 1:
+            try:
+                return self._evaluate_parallel(population)
+            except (BrokenProcessPool, OSError):
+                LSystemCumulativeFitness._executor_workers = 0
+        return evaluate_population(population, self._fitness_strategies)
+
+    def _evaluate_cached(self) -> np.ndarray:
+        """
+        Seuls les génotypes absents du cache sont évalués, une fois chacun même s'ils apparaissent
+        plusieurs fois dans la population. Les valeurs lues dans le cache sont passées à accumulate,
+        l'état des stratégies restant ainsi celui d'une évaluation complète.
+        """
         fitness_array = np.zeros((len(self._fitness_strategies), len(self._population)))
-        
-        for i, lsystem in enumerate(self._population):
-            turtle = Turtle(lsystem.tree, lsystem.angle)
-            turtle.parse()
-            for j, fitness_strategy in enumerate(self._fitness_strategies):
-                fitness_array[j][i] = fitness_strategy.evaluate(turtle, lsystem)
+        keys = [FitnessCache.key(lsystem, self._fitness_strategies) for lsystem in self._population]
+        missing, hits = {}, []
+        for i, key in enumerate(keys):
+            fitness = self._fitness_cache.get(key) if key not in missing else None
+            if fitness is None:
+                missing.setdefault(key, i)
+            else:
+                fitness_array[:, i] = fitness
+                hits.append(i)
+        if missing:
+            evaluated = self._evaluate([self._population[i] for i in missing.values()])
+            columns = {key: column for column, key in enumerate(missing)}
+            for key, column in columns.items():
+                self._fitness_cache.put(key, evaluated[:, column])
+            for i, key in enumerate(keys):
+                if key in columns:
+                    fitness_array[:, i] = evaluated[:, columns[key]]
+        for j, fitness_strategy in enumerate(self._fitness_strategies):
+            fitness_strategy.accumulate(fitness_array[j, hits])
+        return fitness_array
+
+    def compute_fitness(self) -> np.array:
+        if self._fitness_cache is None:
+            fitness_array = self._evaluate(self._population)
+        else:
+            fitness_array = self._evaluate_cached()
         
         for i, fitness_strategy in enumerate(self._fitness_strategies):
             if isinstance(fitness_strategy, HeightFitness):
@@ -274,6 +578,8 @@ class GeneticAlgorithmParameters:
         self.mutation_strategies: MutationStrategy = SymbolMutationStrategy()
         self.crossover_strategy: CrossoverStrategy = NodeCrossoverStrategy()
         self.fitness_strategies: List[FitnessStrategy] = []
+        self.fitness_workers: int = Constant.FITNESS_WORKERS
+        self.fitness_cache: FitnessCache = FitnessCache()
         self.population_size = clamp(Constant.INITIAL_POP_MIN_SIZE, Constant.INITIAL_POP_MAX_SIZE, self.population_size)
         self.elitism_rate = clamp(Constant.MIN_ELITISM_RATE, Constant.MAX_ELITISM_RATE, self.elitism_rate)
         self.population = LSystemFactory.get_random_population(self.population_size)
@@ -283,12 +589,14 @@ class GeneticAlgorithmParameters:
                                                                             BranchFitness(),
                                                                             CanopyFitness(),
                                                                             SymmetryFitness()
-                                                                            ], [0.2, 0., 0.5, 0.3, 0.0])
+                                                                            ], [0.2, 0., 0.5, 0.3, 0.0],
+                                                                            self.fitness_workers, self.fitness_cache)
 
     def update(self) -> None:
         self.population = LSystemFactory.get_random_population(self.population_size)
         self.cumulative_population_fitness = LSystemCumulativeFitness(self.population, self.fitness_strategies,
-                                                                      [1 / len(self.fitness_strategies) for _ in range(len(self.fitness_strategies))])
+                                                                      [1 / len(self.fitness_strategies) for _ in range(len(self.fitness_strategies))],
+                                                                      self.fitness_workers, self.fitness_cache)
 
 
 class GeneticAlgorithm:
@@ -361,7 +669,7 @@ class GeneticAlgorithm:
 
         # Mutation
         for lsystem in self._population:
-            self._parameters.mutation_strategies.mutate(lsystem.tree.root)
+            lsystem.tree.root = self._parameters.mutation_strategies.mutate(lsystem.tree.root)
 
         self._best = self._population[max(np.argsort(self.population_fitness))]
         self._worst = self._population[min(np.argsort(self.population_fitness))]
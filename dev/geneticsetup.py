@@ -1,52 +1,72 @@
 from tree import Tree, Rule, Rules, Node
-from typing import List, Any
+from typing import List, Any, Tuple
 from util import clamp
 from random import randint, random, sample, choices
 from functools import wraps
 from fractions import Fraction
 from abc import ABC, abstractmethod
+from copy import copy
 from constant import Constant
 
 
 class MutationStrategy(ABC):
+    """
+    Une stratégie de mutation retourne la racine de la sous-arborescence mutée : la node elle-même
+    si rien n'a changé, sinon une copie. Les nodes étant partagées entre individus, aucune n'est
+    modifiée en place; seules les nodes modifiées et leurs ancêtres sont copiés.
+    """
     @abstractmethod
-    def mutate(self, root: Node, at_depth: int = 0):
+    def mutate(self, root: Node, at_depth: int = 0) -> Node:
         raise NotImplementedError()
 
+    @staticmethod
+    def replace(root: Node, value: str, children: List[Node]) -> Node:
+        """
+        La node elle-même si sa valeur et ses enfants sont inchangés, sinon une copie les portant.
+        """
+        if value == root.value and len(children) == len(root.child) \
+                and all(new is old for new, old in zip(children, root.child)):
+            return root
+        node = copy(root)
+        node.value = value
+        node.child = children
+        return node
+
 
 class SymbolMutationStrategy(MutationStrategy):
     def __init__(self, symbol_mutation_chance: float = 5e-2):
         self._symbol_mutation_chance = symbol_mutation_chance
         self._symbols_weights = [0.8, 0.1, 0.1]
 
-    def mutate(self, root: Node, at_depth: int = 0) -> None:
+    def mutate(self, root: Node, at_depth: int = 0) -> Node:
         root_value_copy = (list(root.value)).copy()
         for i, gene in enumerate(root.value):
             if gene != Constant.PLACEHOLDER:
                 if random() < self._symbol_mutation_chance:
                     root_value_copy[i] = "".join(choices(Constant.TERMINAL_SET, weights=self._symbols_weights, k=1))
-        root.value = "".join(root_value_copy)
         at_depth += 1
-        for child in root.child:
-            self.mutate(child, at_depth)
+        children = [self.mutate(child, at_depth) for child in root.child]
         at_depth -= 1
+        return self.replace(root, "".join(root_value_copy), children)
 
 
 class NodeMutationStrategy(MutationStrategy):
     def __init__(self, random_pivot: int = 1):
         self._random_pivot = random_pivot
 
-    def mutate(self, root: Node, at_depth: int = 0) -> None:
-        for child in root.child:
+    def mutate(self, root: Node, at_depth: int = 0) -> Node:
+        value = root.value
+        children = list(root.child)
+        for i, child in enumerate(root.child):
             at_depth += 1
             if at_depth == self._random_pivot:
-                cut_off = root.child[randint(0, len(root.child) - 1)]
-                root.child.remove(cut_off)
-                root.child.append(Randomizer.generate_random_tree(1))
-                root.value = Randomizer.shuffle_genotype(root.value)
+                del children[randint(0, len(children) - 1)]
+                children.append(Randomizer.generate_random_tree(1))
+                value = Randomizer.shuffle_genotype(value)
                 break
-            self.mutate(child, at_depth)
+            children[i] = self.mutate(child, at_depth)
             at_depth -= 1
+        return self.replace(root, value, children)
 
 
 class BlockMutationStrategy(MutationStrategy):
@@ -54,7 +74,8 @@ class BlockMutationStrategy(MutationStrategy):
         self._block_mutation_chance = block_mutation_chance
         self._random_pivot = random_pivot
 
-    def mutate(self, root: Node, at_depth: int = 0) -> None:
+    def mutate(self, root: Node, at_depth: int = 0) -> Node:
+        children = []
         for child in root.child:
             at_depth += 1
             if at_depth >= self._random_pivot:
@@ -62,9 +83,11 @@ class BlockMutationStrategy(MutationStrategy):
                     number_of_placeholders = child.value.count(Constant.PLACEHOLDER)
                     mutated_block = Randomizer.generate_random_string()
                     mutated_block += number_of_placeholders * Constant.PLACEHOLDER
+                    child = copy(child)
                     child.value = mutated_block
-            self.mutate(child, at_depth)
+            children.append(self.mutate(child, at_depth))
             at_depth -= 1
+        return self.replace(root, root.value, children)
 
 
 class Randomizer:
@@ -185,6 +208,29 @@ class Traversal:
                     yield i
                 at_depth -= 1
 
+    @staticmethod
+    def node_path_generator(node: Node, path: Tuple[int, ...] = ()):
+        """
+        Comme node_generator, mais chaque node est accompagnée des indices d'enfants menant de la
+        racine jusqu'à elle, afin de pouvoir copier ce chemin avant un croisement (voir Tree.copy_path)
+        """
+        if node.child:
+            yield node, path
+            for index, child in enumerate(node.child):
+                for i in Traversal.node_path_generator(child, path + (index,)):
+                    yield i
+
+    @staticmethod
+    def preorder(node: Node):
+        """
+        Toutes les nodes de la sous-arborescence, parent avant enfants, sans récursion
+        """
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.child))
+
     @staticmethod
     def max_depth(node: Node) -> int:
         if not node.child:
@@ -0,0 +1,905 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from math import sin, cos, radians
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from constant import Constant
+from encoding import encode
+from grammar import Module
+from tree import Tree, Derivation, Node
+from util import Bounds, Point
+
+_FORWARD = Constant.SYMBOL_CODES["F"]
+_LEFT = Constant.SYMBOL_CODES["+"]
+_RIGHT = Constant.SYMBOL_CODES["-"]
+_OPEN = Constant.SYMBOL_CODES["["]
+_CLOSE = Constant.SYMBOL_CODES["]"]
+_PLACEHOLDER = Constant.SYMBOL_CODES[Constant.PLACEHOLDER]
+_VIRTUAL = 255
+_NO_SEGMENTS = np.empty((0, 4))
+_NO_BRANCHES = np.empty((0, 2), dtype=np.intp)
+
+
+class TurtleState:
+    """
+    État de la tortue entre deux tronçons interprétés : cap et position courants, ainsi que les
+    états empilés par les crochets encore ouverts, du plus ancien au plus récent. La position est
+    un complexe x + iy; le cap est en degrés, ou en nombre entier de rotations depuis -90° lorsque
+    la tortue est à cap entier. branch_starts donne, pour chaque crochet encore ouvert, l'indice
+    du premier segment de sa branche. Les nombres de segments et de branches refermées ainsi que
+    la profondeur maximale atteinte sont cumulés d'un tronçon à l'autre.
+    """
+    def __init__(self, heading: float = -90., position: complex = 0j):
+        self.heading = heading
+        self.position = position
+        self.stack: List[Tuple[float, complex]] = []
+        self.branch_starts: List[int] = []
+        self.segment_count: int = 0
+        self.branch_count: int = 0
+        self.max_depth: int = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self.stack)
+
+
+def visible_cumsum(values: np.ndarray, depth: np.ndarray, opens: np.ndarray) -> np.ndarray:
+    """
+    Somme cumulée où chaque position ne retient que les valeurs de ses branches ancêtres : une
+    branche refermée ne compte plus après son crochet fermant. Chaque crochet fermant reçoit
+    l'opposé de la somme des valeurs propres à sa branche, de sorte qu'une seule somme cumulée
+    suffit. Une fois les positions triées par profondeur, les valeurs propres à une branche sont
+    contiguës et commencent à son crochet ouvrant : toutes ces sommes sont obtenues par une seule
+    réduction par segment. Les valeurs des crochets ouvrants sont ignorées.
+    """
+    count = len(values)
+    adjusted = np.where(opens, 0, values)
+    closes = np.flatnonzero(np.diff(depth, prepend=0) < 0)
+    if len(closes):
+        keys = depth.astype(np.int64) * (count + 1) + np.arange(count)
+        order = np.argsort(keys)
+        starts = opens[order]
+        starts[0] = True
+        branch_sums = np.add.reduceat(adjusted[order], np.flatnonzero(starts))
+        branch = np.cumsum(starts) - 1
+        ends = np.searchsorted(keys[order], (depth[closes] + 1) * (count + 1) + closes)
+        adjusted[closes] -= branch_sums[branch[ends - 1]]
+    return np.cumsum(adjusted)
+
+
+@lru_cache(maxsize=64)
+def heading_table(rotation_angle: float) -> Optional[np.ndarray]:
+    """
+    Vecteurs unitaires des caps -90 + k * rotation_angle pour k = 0..n-1, lorsque rotation_angle
+    divise 360 (n = 360 / rotation_angle); None sinon. Les composantes entières sont arrondies,
+    de sorte qu'à 90° les coordonnées restent exactement sur la grille.
+    """
+    if not rotation_angle:
+        return None
+    count = 360. / abs(rotation_angle)
+    if abs(count - round(count)) > 1e-9:
+        return None
+    table = np.exp(1j * np.radians(-90. + rotation_angle * np.arange(round(count))))
+    real, imag = np.round(table.real), np.round(table.imag)
+    table.real = np.where(np.abs(table.real - real) < 1e-12, real, table.real)
+    table.imag = np.where(np.abs(table.imag - imag) < 1e-12, imag, table.imag)
+    table.flags.writeable = False
+    return table
+
+
+def unit_vectors(rotation_angle: float, steps: np.ndarray) -> np.ndarray:
+    """
+    Vecteurs unitaires des caps entiers steps. Sans table, les fonctions trigonométriques ne sont
+    évaluées qu'une fois par cap distinct.
+    """
+    table = heading_table(rotation_angle)
+    if table is not None:
+        return table[steps % len(table)]
+    distinct, inverse = np.unique(steps, return_inverse=True)
+    return np.exp(1j * np.radians(-90. + rotation_angle * distinct))[inverse]
+
+
+def interpret(codes: np.ndarray, rotation_angle: float, segment_length: float = 5.,
+              state: TurtleState = None, integer_heading: bool = False,
+              with_branches: bool = False) -> Tuple[np.ndarray, TurtleState, np.ndarray]:
+    """
+    Interprétation vectorisée d'une chaîne codée. Les caps sont la somme cumulée visible des
+    rotations, les positions celle des déplacements cos/sin de chaque F. L'état de départ est
+    préfixé sous forme de valeurs virtuelles séparées par des crochets ouvrants, ce qui permet
+    d'interpréter une longue chaîne tronçon par tronçon. Retourne les segments (N, 4) en
+    x1, y1, x2, y2, l'état final et, avec with_branches, l'intervalle [début, fin) des indices de
+    segments de chaque branche refermée dans ce tronçon (B, 2).
+
+    À cap entier, les caps sont des entiers exacts lus dans heading_table et les positions sont
+    cumulées en unités de segment_length, donc exactes sur une grille.
+    """
+    state = state if state is not None else TurtleState(0 if integer_heading else -90.)
+    levels = state.stack + [(state.heading, state.position)]
+    prefix_codes = np.full(2 * len(levels) - 1, _OPEN, dtype=np.uint8)
+    prefix_codes[::2] = _VIRTUAL
+    prefix_headings = np.zeros(len(prefix_codes), dtype=np.int64 if integer_heading else float)
+    prefix_positions = np.zeros(len(prefix_codes), dtype=complex)
+    previous_heading, previous_position = 0., 0j
+    for i, (heading, position) in enumerate(levels):
+        prefix_headings[2 * i] = heading - previous_heading
+        prefix_positions[2 * i] = position - previous_position
+        previous_heading, previous_position = heading, position
+
+    all_codes = np.concatenate((prefix_codes, codes))
+    opens = all_codes == _OPEN
+    closes = all_codes == _CLOSE
+    depth = np.cumsum(opens, dtype=np.intp) - np.cumsum(closes, dtype=np.intp)
+    if depth.min(initial=0) < 0:
+        raise ValueError("Chaine invalide")
+
+    if integer_heading:
+        turns = (codes == _LEFT).astype(np.int64) - (codes == _RIGHT)
+    else:
+        turns = np.where(codes == _LEFT, rotation_angle, 0.) - np.where(codes == _RIGHT, rotation_angle, 0.)
+    headings = visible_cumsum(np.concatenate((prefix_headings, turns)), depth, opens)
+
+    forward = all_codes == _FORWARD
+    if integer_heading:
+        units = unit_vectors(rotation_angle, headings[forward])
+    else:
+        units = np.exp(1j * np.radians(headings[forward]))
+    scale = segment_length if integer_heading and segment_length else 1.
+    displacements = np.zeros(len(all_codes), dtype=complex)
+    displacements[forward] = units * (segment_length / scale)
+    displacements[:len(prefix_codes)] = prefix_positions / scale
+    positions = scale * visible_cumsum(displacements, depth, opens)
+
+    ends = positions[forward]
+    starts = ends - scale * displacements[forward]
+    segments = np.column_stack((starts.real, starts.imag, ends.real, ends.imag))
+
+    segment_index = np.cumsum(forward) - forward + state.segment_count
+    segment_index[1:len(prefix_codes):2] = state.branch_starts
+    branches = np.empty((0, 2), dtype=np.intp)
+    if with_branches:
+        brackets = np.flatnonzero(opens | closes)
+        brackets = brackets[np.argsort(depth[brackets] + closes[brackets], kind="stable")]
+        matched = np.flatnonzero(closes[brackets])
+        branches = np.column_stack((segment_index[brackets[matched - 1]], segment_index[brackets[matched]]))
+
+    final_state = TurtleState(headings[-1].item(), complex(positions[-1]))
+    last_open = np.where(opens, np.arange(len(all_codes)), -1)
+    for level in range(1, int(depth[-1]) + 1):
+        at = int(last_open[opens & (depth == level)][-1])
+        final_state.stack.append((headings[at].item(), complex(positions[at])))
+        final_state.branch_starts.append(int(segment_index[at]))
+    final_state.segment_count = state.segment_count + len(segments)
+    final_state.branch_count = state.branch_count + int(np.count_nonzero(closes))
+    final_state.max_depth = max(state.max_depth, int(depth.max()))
+    return segments, final_state, branches
+
+
+class Instance:
+    """
+    Géométrie locale d'une sous-arborescence tracée depuis l'origine : déplacement end et nombre
+    de rotations turn à sa sortie, boîte (min_x, min_y, max_x, max_y) et somme des extrémités de
+    ses segments, nombres de segments et de branches, profondeur maximale relative. Une petite
+    instance conserve ses segments (N, 4) et ses branches (B, 2); une grande ne conserve que ses
+    parts, chacune étant une instance enfant avec sa position et l'indice de son premier segment,
+    ainsi que les branches de son propre niveau. Une instance de statistiques (voir node_instance)
+    ne conserve que ses agrégats. Une instance n'est plus modifiée une fois construite : une copie
+    profonde la partage.
+    """
+    def __init__(self):
+        self.end: complex = 0j
+        self.turn: int = 0
+        self.box: Tuple[float, float, float, float] = (np.inf, np.inf, -np.inf, -np.inf)
+        self.point_sum: complex = 0j
+        self.count: int = 0
+        self.branch_count: int = 0
+        self.max_depth: int = 0
+        self.segments: Optional[np.ndarray] = _NO_SEGMENTS
+        self.branches: np.ndarray = _NO_BRANCHES
+        self.parts: List[Tuple[Instance, complex, int]] = []
+
+    def __deepcopy__(self, memo) -> Instance:
+        return self
+
+    def pieces(self, position: complex = 0j, offset: int = 0) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Segments et branches translatés, morceau par morceau, dans l'ordre de tracé.
+        """
+        if self.segments is not None:
+            yield (self.segments + (position.real, position.imag, position.real, position.imag),
+                   self.branches + offset)
+            return
+        yield np.empty((0, 4)), self.branches + offset
+        for child, at, first in self.parts:
+            yield from child.pieces(position + at, offset + first)
+
+
+class InstanceCache:
+    """
+    Instanciation d'une dérivation prévisible : un symbole développé n fois depuis un cap donné
+    trace toujours la même géométrie, à une translation près. Chaque instance est calculée une
+    fois par (symbole, itérations restantes, indice de cap), le cap étant un nombre entier de
+    rotations comme avec integer_heading, puis réutilisée par translation. Seules les instances
+    d'au plus max_segments segments conservent leurs segments; les autres sont composées de leurs
+    parts, de sorte qu'aucun tableau plus grand n'est construit.
+    """
+    def __init__(self, derivation: Derivation, rotation_angle: float, segment_length: float = 5.,
+                 max_segments: int = 1 << 16, with_branches: bool = False):
+        if not derivation.is_instanceable:
+            raise ValueError("Dérivation non instanciable")
+        self._productions = derivation.rules.productions
+        self._rotation_angle = rotation_angle
+        self._segment_length = segment_length
+        self._max_segments = max_segments
+        self._with_branches = with_branches
+        table = heading_table(rotation_angle)
+        self._heading_count = len(table) if table is not None else 0
+        self._instances: dict = {}
+
+    def __len__(self) -> int:
+        return len(self._instances)
+
+    def instance(self, symbol: str, iterations: int, heading: int) -> Instance:
+        if not iterations or symbol not in self._productions:
+            iterations = 0
+        if self._heading_count:
+            heading %= self._heading_count
+        key = (symbol, iterations, heading)
+        instance = self._instances.get(key)
+        if instance is None:
+            if iterations:
+                instance = self.build(self._productions[symbol], iterations - 1, heading)
+            else:
+                instance = self._leaf(symbol, heading)
+            self._instances[key] = instance
+        return instance
+
+    def _leaf(self, symbol: str, heading: int) -> Instance:
+        instance = Instance()
+        if symbol == "F":
+            end = complex(unit_vectors(self._rotation_angle, np.array([heading]))[0]) * self._segment_length
+            instance.end, instance.point_sum, instance.count = end, end, 1
+            instance.box = (min(end.real, 0.), min(end.imag, 0.), max(end.real, 0.), max(end.imag, 0.))
+            instance.segments = np.array([[0., 0., end.real, end.imag]])
+        elif symbol == "+":
+            instance.turn = 1
+        elif symbol == "-":
+            instance.turn = -1
+        return instance
+
+    def build(self, symbols: str, iterations: int, heading: int = 0) -> Instance:
+        """
+        Instance de la chaîne symbols dont chaque symbole est développé iterations fois.
+        """
+        instance = Instance()
+        position, turn = 0j, 0
+        stack: List[Tuple[complex, int, int]] = []
+        branches: List[Tuple[int, int]] = []
+        min_x, min_y, max_x, max_y = instance.box
+        for symbol in symbols:
+            if symbol == "[":
+                stack.append((position, turn, instance.count))
+                instance.max_depth = max(instance.max_depth, len(stack))
+                continue
+            if symbol == "]":
+                if not stack:
+                    raise ValueError("Chaine invalide")
+                position, turn, start = stack.pop()
+                branches.append((start, instance.count))
+                instance.branch_count += 1
+                continue
+            child = self.instance(symbol, iterations, heading + turn)
+            if child.count or child.branch_count:
+                instance.parts.append((child, position, instance.count))
+                instance.point_sum += child.point_sum + child.count * position
+                instance.branch_count += child.branch_count
+                instance.max_depth = max(instance.max_depth, len(stack) + child.max_depth)
+                if child.count:
+                    min_x, max_x = min(min_x, child.box[0] + position.real), max(max_x, child.box[2] + position.real)
+                    min_y, max_y = min(min_y, child.box[1] + position.imag), max(max_y, child.box[3] + position.imag)
+                instance.count += child.count
+            position += child.end
+            turn += child.turn
+        if stack:
+            raise ValueError("Chaine invalide")
+        instance.end, instance.turn, instance.box = position, turn, (min_x, min_y, max_x, max_y)
+        if self._with_branches and branches:
+            instance.branches = np.array(branches, dtype=np.intp)
+        instance.segments = None
+        if instance.count <= self._max_segments:
+            pieces = list(instance.pieces())
+            instance.segments = np.concatenate([segments for segments, _ in pieces])
+            instance.branches = np.concatenate([branches for _, branches in pieces])
+            instance.parts = []
+        return instance
+
+
+class Contribution:
+    """
+    Agrégats d'une sous-arborescence tracée depuis l'origine au cap entier 0, indépendants de
+    l'angle : nombres de segments et de branches, profondeur maximale relative, nombre de
+    rotations à sa sortie et, pour chaque cap low + j, sums[j] compte les pas faits dans ce cap
+    jusqu'à chacune de ses extrémités de segment; leur somme pour un angle donné est le produit
+    de sums par les vecteurs unitaires des caps. reach, le plus grand nombre de pas menant à une
+    extrémité, borne sa distance à l'origine quel que soit l'angle (voir node_box).
+    """
+    __slots__ = ("count", "branch_count", "max_depth", "turn", "low", "sums", "reach")
+
+    def __init__(self, count: int, branch_count: int, max_depth: int, turn: int, low: int,
+                 sums: Tuple[int, ...], reach: int):
+        self.count = count
+        self.branch_count = branch_count
+        self.max_depth = max_depth
+        self.turn = turn
+        self.low = low
+        self.sums = sums
+        self.reach = reach
+
+    def __deepcopy__(self, memo) -> Contribution:
+        return self
+
+
+@lru_cache(maxsize=1 << 14)
+def _own_steps(value: str) -> Tuple[np.ndarray, Contribution, Tuple[int, ...], Tuple[Tuple[int, ...], ...]]:
+    """
+    Pas faits dans chaque cap low + j par les symboles propres à une node, ses substituts étant
+    ignorés : une ligne par extrémité de segment, puis une par substitut et une pour la sortie.
+    Retourne aussi la Contribution de ces seuls symboles, ainsi que le cap et la ligne de pas de
+    chaque substitut. Ne dépend que de la valeur : les nodes de même valeur la partagent. Les
+    valeurs étant courtes, elles sont parcourues sans NumPy.
+    """
+    heading, steps, headings = 0, [], []
+    for char in value:
+        if char == "F":
+            steps.append(heading)
+        elif char == "+":
+            heading += 1
+        elif char == "-":
+            heading -= 1
+        elif char == Constant.PLACEHOLDER:
+            headings.append(heading)
+    low = min(steps) if steps else 0
+    width = max(steps) - low + 1 if steps else 0
+    current, forward_rows, rows = [0] * width, [], []
+    for char in value:
+        if char == "F":
+            current[steps[len(forward_rows)] - low] += 1
+            forward_rows.append(tuple(current))
+        elif char == Constant.PLACEHOLDER:
+            rows.append(tuple(current))
+    table = np.array(forward_rows + rows + [tuple(current)], dtype=float).reshape(len(steps) + len(rows) + 1, width)
+    table.flags.writeable = False
+    sums = tuple(sum(column) for column in zip(*forward_rows)) if forward_rows else (0,) * width
+    own = Contribution(len(steps), 0, 0, heading, low, sums, len(steps))
+    return table, own, tuple(headings), tuple(rows)
+
+
+def _unit_columns(rotation_angle: float, start: int, width: int) -> np.ndarray:
+    """
+    Vecteurs unitaires (width, 2) des caps entiers start à start + width - 1.
+    """
+    units = unit_vectors(rotation_angle, np.arange(start, start + width))
+    return np.stack((units.real, units.imag), axis=1)
+
+
+def node_contribution(node: Node) -> Contribution:
+    """
+    Contribution d'une sous-arborescence : celle de ses symboles propres, à laquelle chaque
+    enfant ajoute la sienne, décalée de son cap et augmentée de ses segments multipliés par les
+    pas faits jusqu'à son substitut. Les sommes étant entières et de quelques caps seulement,
+    elles sont combinées sans NumPy. Le résultat est conservé dans node.contribution jusqu'à la
+    prochaine invalidation : après une mutation ou un croisement, seules les nodes invalidées
+    sont recombinées, quel que soit le nouvel angle de l'individu.
+    """
+    contribution = node.contribution
+    if contribution is not None:
+        return contribution
+    _, own, headings, rows = _own_steps(node.value)
+    if not node.child:
+        node.contribution = own
+        return own
+
+    contributions = []
+    count, branch_count, max_depth, reach = own.count, 0, 0, own.reach
+    low, high = own.low, own.low + len(own.sums)
+    for child, heading, row in zip(node.child, headings, rows):
+        child_contribution = child.contribution
+        if child_contribution is None:
+            child_contribution = node_contribution(child)
+        count += child_contribution.count
+        branch_count += child_contribution.branch_count + 1
+        max_depth = max(max_depth, child_contribution.max_depth + 1)
+        if child_contribution.count:
+            contributions.append((child_contribution, heading, row))
+            reach = max(reach, sum(row) + child_contribution.reach)
+            low = min(low, child_contribution.low + heading)
+            high = max(high, child_contribution.low + heading + len(child_contribution.sums))
+
+    sums = [0] * (high - low)
+    own_start = own.low - low
+    for j, total in enumerate(own.sums, own_start):
+        sums[j] = total
+    for child_contribution, heading, row in contributions:
+        for j, total in enumerate(child_contribution.sums, child_contribution.low + heading - low):
+            sums[j] += total
+        for j, step in enumerate(row, own_start):
+            sums[j] += child_contribution.count * step
+    contribution = Contribution(count, branch_count, max_depth, own.turn, low, tuple(sums), reach)
+    node.contribution = contribution
+    return contribution
+
+
+def node_box(node: Node, rotation_angle: float, heading: int = 0) -> Tuple[float, float, float, float]:
+    """
+    Boîte (min_x, min_y, max_x, max_y) des extrémités de segments d'une sous-arborescence non vide
+    tracée depuis l'origine au cap entier heading, en unités de longueur de segment. Les vecteurs
+    unitaires de tous ses caps sont calculés une seule fois; les extrémités propres à chaque node
+    sont obtenues par un seul produit matriciel et un enfant n'est parcouru que si le disque de
+    rayon reach centré sur son substitut déborde de la boîte courante. Le parcours se fait dans un
+    ordre fixe : le résultat ne dépend que de la sous-arborescence, de l'angle et du cap.
+    """
+    contribution = node_contribution(node)
+    start = heading + contribution.low
+    columns = _unit_columns(rotation_angle, start, len(contribution.sums))
+    box = [np.inf, np.inf, -np.inf, -np.inf]
+    _extend_box(node, columns, heading - start, 0., 0., box)
+    return box[0], box[1], box[2], box[3]
+
+
+def _extend_box(node: Node, columns: np.ndarray, offset: int, x: float, y: float, box: List[float]) -> None:
+    """
+    Étend box des extrémités d'une sous-arborescence tracée depuis (x, y), la ligne offset + j de
+    columns étant le vecteur unitaire de son cap j.
+    """
+    steps, own, headings, _ = _own_steps(node.value)
+    count = own.count
+    positions = steps @ columns[offset + own.low:offset + own.low + steps.shape[1]]
+    if count:
+        (min_x, min_y), (max_x, max_y) = positions[:count].min(axis=0).tolist(), positions[:count].max(axis=0).tolist()
+        box[0], box[1] = min(box[0], x + min_x), min(box[1], y + min_y)
+        box[2], box[3] = max(box[2], x + max_x), max(box[3], y + max_y)
+    for child, heading, (dx, dy) in zip(node.child, headings, positions[count:].tolist()):
+        contribution = child.contribution
+        reach = contribution.reach
+        child_x, child_y = x + dx, y + dy
+        if contribution.count and (child_x - reach < box[0] or child_y - reach < box[1] or child_x + reach > box[2]
+                                   or child_y + reach > box[3]):
+            _extend_box(child, columns, offset + heading, child_x, child_y, box)
+
+
+def node_instance(node: Node, rotation_angle: float, heading: int = 0) -> Instance:
+    """
+    Agrégats d'une sous-arborescence tracée depuis l'origine au cap entier heading, en unités de
+    longueur de segment : la somme et le déplacement de sortie à partir de sa Contribution, la
+    boîte par node_box.
+    """
+    contribution = node_contribution(node)
+    steps, own, _, _ = _own_steps(node.value)
+    instance = Instance()
+    instance.segments = None
+    instance.turn = contribution.turn
+    instance.count = contribution.count
+    instance.branch_count = contribution.branch_count
+    instance.max_depth = contribution.max_depth
+    end = steps[-1] @ _unit_columns(rotation_angle, heading + own.low, steps.shape[1])
+    instance.end = complex(end[0], end[1])
+    if instance.count:
+        x_sum, y_sum = np.array(contribution.sums, dtype=float) @ _unit_columns(
+            rotation_angle, heading + contribution.low, len(contribution.sums))
+        instance.point_sum = complex(x_sum, y_sum)
+        instance.box = node_box(node, rotation_angle, heading)
+    return instance
+
+
+class Polylines:
+    """
+    Géométrie simplifiée : sommets (M, 2) de polylignes concaténées, offsets[k]:offsets[k + 1]
+    délimitant les sommets de la k-ième. removed est le nombre de segments retirés.
+    """
+    def __init__(self, vertices: np.ndarray, offsets: np.ndarray, removed: int):
+        self.vertices = vertices
+        self.offsets = offsets
+        self.removed = removed
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        return self.vertices[self.offsets[index]:self.offsets[index + 1]]
+
+    @property
+    def segments(self) -> np.ndarray:
+        """
+        Segments (N, 4) reliant les sommets consécutifs de chaque polyligne.
+        """
+        inner = np.ones(len(self.vertices), dtype=bool)
+        inner[self.offsets[1:] - 1] = False
+        inner = inner[:-1]
+        return np.column_stack((self.vertices[:-1][inner], self.vertices[1:][inner]))
+
+
+def simplify(segments: np.ndarray, tolerance: float = Constant.SEGMENT_TOLERANCE) -> Polylines:
+    """
+    Retire les segments de longueur nulle et les doublons, dans un sens comme dans l'autre, par une
+    clé formée des extrémités quantifiées à tolerance; la première occurrence est conservée. Les
+    segments consécutifs qui se prolongent sont ensuite chaînés en polylignes, les sommets
+    intermédiaires d'une suite colinéaire étant retirés.
+    """
+    if not len(segments):
+        return Polylines(np.empty((0, 2)), np.zeros(1, dtype=np.intp), 0)
+    count = len(segments)
+    quantized = np.round(segments / tolerance).astype(np.int64)
+    kept = np.any(quantized[:, :2] != quantized[:, 2:], axis=1)
+    swap = (quantized[:, 0] > quantized[:, 2]) | ((quantized[:, 0] == quantized[:, 2])
+                                                  & (quantized[:, 1] > quantized[:, 3]))
+    keys = np.where(swap[:, None], quantized[:, [2, 3, 0, 1]], quantized)
+    _, first = np.unique(keys[kept], axis=0, return_index=True)
+    order = np.flatnonzero(kept)[np.sort(first)]
+    segments, quantized = segments[order], quantized[order]
+
+    continues = np.zeros(len(segments), dtype=bool)
+    continues[1:] = np.all(quantized[:-1, 2:] == quantized[1:, :2], axis=1)
+    directions = segments[:, 2:] - segments[:, :2]
+    cross = directions[:-1, 0] * directions[1:, 1] - directions[:-1, 1] * directions[1:, 0]
+    dot = np.einsum("ij,ij->i", directions[:-1], directions[1:])
+    norms = np.hypot(directions[:, 0], directions[:, 1])
+    collinear = np.zeros(len(segments), dtype=bool)
+    collinear[1:] = continues[1:] & (np.abs(cross) <= 1e-9 * norms[:-1] * norms[1:]) & (dot > 0)
+
+    keep_start = ~continues
+    keep_end = np.ones(len(segments), dtype=bool)
+    keep_end[:-1] = ~collinear[1:]
+    vertices = np.stack((segments[:, :2], segments[:, 2:]), axis=1).reshape(-1, 2)
+    vertices = vertices[np.column_stack((keep_start, keep_end)).ravel()]
+    counts = keep_start.astype(np.intp) + keep_end
+    offsets = np.zeros(np.count_nonzero(keep_start) + 1, dtype=np.intp)
+    offsets[1:] = np.add.reduceat(counts, np.flatnonzero(keep_start)).cumsum()
+    return Polylines(vertices, offsets, count - (len(vertices) - (len(offsets) - 1)))
+
+
+class BranchHierarchy:
+    """
+    Boîtes englobantes des branches délimitées par les crochets. Les segments d'une branche étant
+    contigus dans l'ordre de tracé, chaque boîte est une réduction sur un intervalle de segments,
+    calculée une fois. Les branches sont triées parent avant enfant.
+    """
+    def __init__(self, segments: np.ndarray, branches: np.ndarray):
+        branches = branches[branches[:, 0] < branches[:, 1]]
+        self._segments = segments
+        self._branches = branches[np.lexsort((-branches[:, 1], branches[:, 0]))]
+        lower = np.minimum(segments[:, :2], segments[:, 2:])
+        upper = np.maximum(segments[:, :2], segments[:, 2:])
+        self._segment_boxes = np.column_stack((lower, upper))
+        if len(self._branches):
+            padded_lower = np.concatenate((lower, lower[-1:]))
+            padded_upper = np.concatenate((upper, upper[-1:]))
+            limits = self._branches.ravel()
+            self._boxes = np.column_stack((np.minimum.reduceat(padded_lower, limits)[::2],
+                                           np.maximum.reduceat(padded_upper, limits)[::2]))
+        else:
+            self._boxes = np.empty((0, 4))
+
+    @property
+    def branches(self) -> np.ndarray:
+        return self._branches
+
+    @property
+    def boxes(self) -> np.ndarray:
+        """
+        Boîte (min_x, min_y, max_x, max_y) de chaque branche.
+        """
+        return self._boxes
+
+    @staticmethod
+    def _outside(boxes: np.ndarray, viewport: Tuple[float, float, float, float]) -> np.ndarray:
+        min_x, min_y, max_x, max_y = viewport
+        return (boxes[:, 2] < min_x) | (boxes[:, 0] > max_x) | (boxes[:, 3] < min_y) | (boxes[:, 1] > max_y)
+
+    def level_of_detail(self, viewport: Tuple[float, float, float, float], pixel_size: float,
+                        threshold: float = Constant.LOD_THRESHOLD) -> np.ndarray:
+        """
+        Segments à tracer pour une fenêtre (min_x, min_y, max_x, max_y) où un pixel mesure
+        pixel_size : une branche hors de la fenêtre est omise, une branche dont la boîte mesure moins
+        de threshold pixels est remplacée par un trait de son point de départ au centre de sa boîte.
+        Seules les branches les plus englobantes sont retenues, leurs descendants étant couverts.
+        """
+        extent = np.maximum(self._boxes[:, 2] - self._boxes[:, 0], self._boxes[:, 3] - self._boxes[:, 1])
+        outside = BranchHierarchy._outside(self._boxes, viewport)
+        collapsed = ~outside & (extent < threshold * pixel_size)
+        hidden = np.flatnonzero(outside | collapsed)
+        starts, ends = self._branches[hidden, 0], self._branches[hidden, 1]
+        reach = np.maximum.accumulate(ends)
+        outermost = np.ones(len(hidden), dtype=bool)
+        outermost[1:] = starts[1:] >= reach[:-1]
+        hidden, starts, ends = hidden[outermost], starts[outermost], ends[outermost]
+
+        coverage = np.zeros(len(self._segments) + 1, dtype=np.intp)
+        np.add.at(coverage, starts, 1)
+        np.add.at(coverage, ends, -1)
+        visible = (np.cumsum(coverage)[:-1] == 0) & ~BranchHierarchy._outside(self._segment_boxes, viewport)
+
+        strokes = hidden[collapsed[hidden]]
+        centers = (self._boxes[strokes, :2] + self._boxes[strokes, 2:]) / 2.
+        strokes = np.column_stack((self._segments[self._branches[strokes, 0], :2], centers))
+        return np.concatenate((self._segments[visible], strokes))
+
+
+class Turtle:
+    """
+    Interprète un arbre, une chaîne codée en uint8, ou un flux de symboles tel que produit par
+    Tree.derive, sans dépendre de Qt. Les chaînes sont interprétées par interpret en tronçons
+    d'au plus chunk_size symboles; un flux n'est donc jamais matérialisé en entier.
+
+    Avec statistics_only, seuls les agrégats sont conservés (limites, centroïde, sommes des coordonnées,
+    nombre de segments, de branches et profondeur maximale) : la mémoire ne dépend alors que de
+    chunk_size, quelle que soit la taille du génome.
+
+    Avec integer_heading, le cap est un nombre entier de rotations et les vecteurs unitaires sont
+    lus dans une table calculée une fois par angle (voir heading_table). Les angles des modules
+    paramétriques doivent alors être des multiples de rotation_angle.
+
+    Avec with_hierarchy, l'intervalle de segments de chaque branche est conservé pour construire
+    une BranchHierarchy.
+
+    Une Derivation instanciable est interprétée par un InstanceCache, à cap entier : les segments
+    sont produits par translation des instances, et en mode statistiques parse se contente de
+    combiner leurs agrégats. De même, un Tree en mode statistiques et à cap entier est évalué par
+    node_instance, à partir des Contribution conservées dans ses nodes.
+    """
+    chunk_size: int = 1 << 16
+
+    def __init__(self, tree: Union[Tree, Derivation, np.ndarray, Iterable[str]], rotation_angle: float,
+                 segment_length: float = 5., statistics_only: bool = False, integer_heading: bool = False,
+                 with_hierarchy: bool = False):
+        if not isinstance(tree, (Tree, Derivation, np.ndarray, Iterator)):
+            raise TypeError("Arbre doit être de type Tree ou un itérateur de symboles")
+        self._segment_length = segment_length
+        self._statistics_only = statistics_only
+        self._integer_heading = integer_heading
+        self._with_hierarchy = with_hierarchy
+        self._tree = tree
+        self._rotation_angle: float = rotation_angle
+        self._state = TurtleState(0 if integer_heading else -90.)
+        self._segments: List[np.ndarray] = []
+        self._branches: List[np.ndarray] = []
+        self._recent: List[np.ndarray] = []
+        self._pending: List[Tuple[float, float, float, float]] = []
+        self._point_count: int = 1
+        self._point_sum: complex = 0j
+        self._bounds = Bounds()
+
+    @property
+    def segments(self) -> np.ndarray:
+        """
+        Segments (N, 4) en x1, y1, x2, y2, dans l'ordre de tracé.
+        """
+        if self._statistics_only:
+            raise ValueError("Segments non conservés en mode statistiques")
+        if len(self._segments) != 1:
+            self._segments = [np.concatenate(self._segments) if self._segments else np.empty((0, 4))]
+        return self._segments[0]
+
+    @property
+    def hierarchy(self) -> BranchHierarchy:
+        if not self._with_hierarchy:
+            raise ValueError("Hiérarchie non conservée")
+        branches = np.concatenate(self._branches) if self._branches else np.empty((0, 2), dtype=np.intp)
+        return BranchHierarchy(self.segments, branches)
+
+    @property
+    def points(self) -> np.ndarray:
+        """
+        Point de départ suivi de l'extrémité de chaque segment, (N + 1, 2).
+        """
+        return np.concatenate((np.zeros((1, 2)), self.segments[:, 2:]))
+
+    @property
+    def x_sum(self) -> float:
+        return self._point_sum.real
+
+    @property
+    def y_sum(self) -> float:
+        return self._point_sum.imag
+
+    @property
+    def centroid(self) -> Point:
+        return Point(self._point_sum.real / self._point_count, self._point_sum.imag / self._point_count)
+
+    @property
+    def bounds(self) -> Bounds:
+        return self._bounds
+
+    @property
+    def statistics_only(self) -> bool:
+        return self._statistics_only
+
+    @property
+    def segment_count(self) -> int:
+        return self._point_count - 1
+
+    @property
+    def branch_count(self) -> int:
+        return self._state.branch_count
+
+    @property
+    def max_depth(self) -> int:
+        return self._state.max_depth
+
+    def parse(self) -> None:
+        if self._statistics_only and isinstance(self._tree, Derivation) and self._tree.is_instanceable:
+            self._add_instance(self._instance_cache().build(self._tree.axiom, self._tree.iterations))
+            return
+        if self._statistics_only and self._integer_heading and isinstance(self._tree, Tree):
+            self._add_instance(node_instance(self._tree.root, self._rotation_angle), self._segment_length)
+            return
+        for _ in self.parse_chunks():
+            pass
+
+    def parse_chunks(self) -> Iterator[np.ndarray]:
+        """
+        Interprète tronçon par tronçon et produit les segments (N, 4) de chacun, ce qui permet de
+        tracer au fur et à mesure ou d'abandonner en cours de route.
+        """
+        if isinstance(self._tree, Derivation):
+            if self._tree.is_instanceable:
+                yield from self._instance_chunks()
+            else:
+                yield from self._stream_chunks(self._tree.symbols())
+            return
+        if isinstance(self._tree, Tree):
+            codes = encode(self._tree.solution())
+        elif isinstance(self._tree, np.ndarray):
+            codes = self._tree
+        else:
+            yield from self._stream_chunks(self._tree)
+            return
+        for start in range(0, len(codes), self.chunk_size):
+            self._interpret(codes[start:start + self.chunk_size])
+            yield self._take_recent()
+        if self._state.depth:
+            raise ValueError("Chaine invalide")
+
+    def stream_parser(self, symbols: Iterable[Union[str, Module]]) -> None:
+        for _ in self._stream_chunks(symbols):
+            pass
+
+    def _stream_chunks(self, symbols: Iterable[Union[str, Module]]) -> Iterator[np.ndarray]:
+        """
+        Les modules paramétriques (symbole, paramètres) sont acceptés : le premier paramètre de F
+        donne la longueur du segment, celui de + et - l'angle de rotation. Ils sont interprétés un
+        à un, les symboles simples étant regroupés en tronçons. Les symboles hors de l'alphabet
+        sont ignorés.
+        """
+        buffer = []
+        for char in symbols:
+            parameters = ()
+            if isinstance(char, tuple):
+                char, parameters = char
+            if char in Constant.SYMBOL_CODES and (not parameters or char in Constant.FUNCTION_SET):
+                buffer.append(char)
+                if len(buffer) == self.chunk_size:
+                    self._interpret(encode("".join(buffer)))
+                    buffer.clear()
+                    yield self._take_recent()
+                continue
+            if buffer:
+                self._interpret(encode("".join(buffer)))
+                buffer.clear()
+            if char == "+":
+                self._rotate_left(*parameters[:1])
+            elif char == "-":
+                self._rotate_right(*parameters[:1])
+            elif char == "F":
+                self._draw_straight_line(*parameters[:1])
+                if len(self._pending) == self.chunk_size:
+                    self._flush()
+                    yield self._take_recent()
+        if buffer:
+            self._interpret(encode("".join(buffer)))
+        self._flush()
+        yield self._take_recent()
+        if self._state.depth:
+            raise ValueError("Chaine invalide")
+
+    def _instance_cache(self) -> InstanceCache:
+        return InstanceCache(self._tree, self._rotation_angle, self._segment_length, self.chunk_size,
+                             self._with_hierarchy)
+
+    def _instance_chunks(self) -> Iterator[np.ndarray]:
+        """
+        Les morceaux de l'instance racine sont regroupés en tronçons d'au moins chunk_size segments.
+        Les agrégats, limites comprises, sont connus dès le premier tronçon.
+        """
+        instance = self._instance_cache().build(self._tree.axiom, self._tree.iterations)
+        self._add_instance(instance)
+        size = 0
+        for segments, branches in instance.pieces():
+            if len(segments):
+                self._recent.append(segments)
+                if not self._statistics_only:
+                    self._segments.append(segments)
+                size += len(segments)
+            if len(branches):
+                self._branches.append(branches)
+            if size >= self.chunk_size:
+                size = 0
+                yield self._take_recent()
+        yield self._take_recent()
+
+    def _add_instance(self, instance: Instance, scale: float = 1.) -> None:
+        """
+        Agrégats d'une instance tracée depuis l'origine, ses coordonnées étant multipliées par scale.
+        """
+        if instance.count:
+            min_x, min_y, max_x, max_y = (scale * value for value in instance.box)
+            self._bounds.extend(min_x, max_x, min_y, max_y)
+        self._point_sum += scale * instance.point_sum
+        self._point_count += instance.count
+        heading = instance.turn if self._integer_heading else -90. + instance.turn * self._rotation_angle
+        segment_count = self._state.segment_count + instance.count
+        branch_count = self._state.branch_count + instance.branch_count
+        self._state = TurtleState(heading, scale * instance.end)
+        self._state.segment_count, self._state.branch_count = segment_count, branch_count
+        self._state.max_depth = instance.max_depth
+
+    def _take_recent(self) -> np.ndarray:
+        recent = np.concatenate(self._recent) if self._recent else np.empty((0, 4))
+        self._recent.clear()
+        return recent
+
+    def _interpret(self, codes: np.ndarray) -> None:
+        self._flush()
+        segments, self._state, branches = interpret(codes, self._rotation_angle, self._segment_length,
+                                                    self._state, self._integer_heading, self._with_hierarchy)
+        self._add_segments(segments)
+        if len(branches):
+            self._branches.append(branches)
+
+    def _add_segments(self, segments: np.ndarray) -> None:
+        if not len(segments):
+            return
+        ends = segments[:, 2:]
+        (min_x, min_y), (max_x, max_y) = ends.min(axis=0), ends.max(axis=0)
+        self._bounds.extend(min_x, max_x, min_y, max_y)
+        x_sum, y_sum = ends.sum(axis=0)
+        self._point_sum += complex(x_sum, y_sum)
+        self._point_count += len(segments)
+        self._recent.append(segments)
+        if not self._statistics_only:
+            self._segments.append(segments)
+
+    def _flush(self) -> None:
+        if self._pending:
+            self._add_segments(np.array(self._pending))
+            self._pending.clear()
+
+    def _draw_straight_line(self, segment_length: float = None):
+        segment_length = self._segment_length if segment_length is None else segment_length
+        start = self._state.position
+        if self._integer_heading:
+            direction = complex(unit_vectors(self._rotation_angle, np.array([self._state.heading]))[0])
+        else:
+            direction = complex(cos(radians(self._state.heading)), sin(radians(self._state.heading)))
+        self._state.position = start + segment_length * direction
+        self._state.segment_count += 1
+        self._pending.append((start.real, start.imag, self._state.position.real, self._state.position.imag))
+
+    def _turn(self, rotation_angle: float = None) -> Union[int, float]:
+        if not self._integer_heading:
+            return self._rotation_angle if rotation_angle is None else rotation_angle
+        if rotation_angle is None:
+            return 1
+        if not self._rotation_angle:
+            raise ValueError("Cap entier impossible avec un angle de rotation nul")
+        steps = rotation_angle / self._rotation_angle
+        if abs(steps - round(steps)) > 1e-9:
+            raise ValueError("Angle incompatible avec le cap entier")
+        return round(steps)
+
+    def _rotate_right(self, rotation_angle: float = None):
+        self._state.heading -= self._turn(rotation_angle)
+
+    def _rotate_left(self, rotation_angle: float = None):
+        self._state.heading += self._turn(rotation_angle)
@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+import ast
+from array import array
+from math import sin, cos, tan, sqrt, exp, log, radians, degrees
+from typing import List, Tuple, Dict, Optional, Iterable, Union
+
+from constant import Constant
+
+Module = Tuple[str, Tuple[float, ...]]
+
+
+class Expression:
+    """
+    Expression arithmétique ou logique d'une production paramétrique. L'arbre syntaxique est
+    validé à la construction : seuls les nombres, les paramètres formels, les opérateurs et
+    quelques fonctions mathématiques sont permis. L'expression n'est compilée qu'une fois.
+    """
+    _functions = {"sin": sin, "cos": cos, "tan": tan, "sqrt": sqrt, "exp": exp, "log": log,
+                  "radians": radians, "degrees": degrees, "min": min, "max": max, "abs": abs}
+    _allowed_nodes = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.Name, ast.Load,
+                      ast.Constant, ast.Call, ast.operator, ast.unaryop, ast.boolop, ast.cmpop)
+
+    def __init__(self, source: str, variables: Iterable[str] = ()):
+        try:
+            syntax_tree = ast.parse(source.strip(), mode="eval")
+        except SyntaxError:
+            raise ValueError(f"Expression invalide : {source}")
+        variables = set(variables)
+        for node in ast.walk(syntax_tree):
+            if not isinstance(node, Expression._allowed_nodes):
+                raise ValueError(f"Expression invalide : {source}")
+            if isinstance(node, ast.Name) and node.id not in variables and node.id not in Expression._functions:
+                raise ValueError(f"Paramètre inconnu : {node.id}")
+            if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name)
+                                                   and node.func.id in Expression._functions):
+                raise ValueError(f"Fonction inconnue : {source}")
+            if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+                raise ValueError(f"Expression invalide : {source}")
+        self._source = source.strip()
+        self._code = compile(syntax_tree, "<expression>", "eval")
+
+    @property
+    def source(self) -> str:
+        return self._source
+
+    def __call__(self, bindings: Dict[str, float]) -> float:
+        return eval(self._code, {"__builtins__": {}, **Expression._functions}, bindings)
+
+
+def _split_arguments(arguments: str) -> List[str]:
+    pieces, depth, start = [], 0, 0
+    for i, char in enumerate(arguments):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and not depth:
+            pieces.append(arguments[start:i])
+            start = i + 1
+    pieces.append(arguments[start:])
+    return [piece.strip() for piece in pieces]
+
+
+def split_modules(value: str) -> List[Tuple[str, List[str]]]:
+    """
+    Découpe une chaîne en modules : un symbole, suivi éventuellement de ses arguments entre
+    parenthèses, par exemple "F(x * 2)[+A(1, y)]". Les espaces sont ignorés.
+    """
+    modules = []
+    i = 0
+    while i < len(value):
+        char = value[i]
+        i += 1
+        if char.isspace():
+            continue
+        if char in "(),":
+            raise ValueError(f"Module invalide : {value}")
+        arguments = []
+        while i < len(value) and value[i].isspace():
+            i += 1
+        if i < len(value) and value[i] == "(":
+            depth = 0
+            for j in range(i, len(value)):
+                if value[j] == "(":
+                    depth += 1
+                elif value[j] == ")":
+                    depth -= 1
+                    if not depth:
+                        break
+            else:
+                raise ValueError(f"Parenthèse non fermée : {value}")
+            arguments = _split_arguments(value[i + 1:j])
+            i = j + 1
+        modules.append((char, arguments))
+    return modules
+
+
+def parse_modules(value: str) -> List[Module]:
+    return [(symbol, tuple(float(Expression(argument)({})) for argument in arguments))
+            for symbol, arguments in split_modules(value)]
+
+
+def to_string(modules: Iterable[Module]) -> str:
+    return "".join(symbol + (f"({','.join(f'{parameter:g}' for parameter in parameters)})" if parameters else "")
+                   for symbol, parameters in modules)
+
+
+class BracketIndex:
+    """
+    Index construit une fois par étape de dérivation, en deux passes linéaires : crochet
+    correspondant de chaque crochet, puis voisins gauche et droit de chaque module en sautant
+    les branches latérales et les symboles ignorés. Le voisin gauche est lu sur le chemin vers
+    la racine, le voisin droit sur la même branche; chaque recherche de contexte est donc O(1).
+    """
+    def __init__(self, modules: List[Module], ignore: Iterable[str] = ()):
+        ignore = frozenset(ignore)
+        self.match = array("l", [-1]) * len(modules)
+        self.left = array("l", [-1]) * len(modules)
+        self.right = array("l", [-1]) * len(modules)
+
+        stack, last = [], -1
+        for i, (symbol, _) in enumerate(modules):
+            if symbol == "[":
+                stack.append((i, last))
+            elif symbol == "]":
+                if not stack:
+                    raise ValueError("Chaine invalide")
+                opening, last = stack.pop()
+                self.match[i], self.match[opening] = opening, i
+            else:
+                self.left[i] = last
+                if symbol not in ignore:
+                    last = i
+        if stack:
+            raise ValueError("Chaine invalide")
+
+        following = -1
+        for i in range(len(modules) - 1, -1, -1):
+            symbol = modules[i][0]
+            if symbol == "]":
+                stack.append(following)
+                following = -1
+            elif symbol == "[":
+                following = stack.pop()
+            else:
+                self.right[i] = following
+                if symbol not in ignore:
+                    following = i
+
+
+class ContextRule:
+    """
+    Production sensible au contexte et paramétrique, notée comme dans The Algorithmic Beauty of Plants :
+    "gauche < prédécesseur > droite : condition -> successeur", seuls le prédécesseur et le successeur
+    étant obligatoires. Par exemple "A(x) < B(y) > C : x + y < 4 -> B(x + 1)[+F(y)]".
+    """
+    def __init__(self, production: str):
+        if "->" not in production:
+            raise ValueError("Production doit comporter une flèche (->)")
+        head, successor = production.split("->", 1)
+        condition = None
+        if ":" in head:
+            head, condition = head.split(":", 1)
+        left, right = "", ""
+        if "<" in head:
+            left, head = head.split("<", 1)
+        if ">" in head:
+            head, right = head.split(">", 1)
+        predecessor = split_modules(head)
+        if len(predecessor) != 1:
+            raise ValueError("Le prédécesseur doit être un seul module")
+        self._symbol, self._formals = predecessor[0]
+        self._left = split_modules(left)
+        self._right = split_modules(right)
+        variables = list(self._formals)
+        for symbol, formals in [predecessor[0]] + self._left + self._right:
+            if symbol in Constant.FUNCTION_SET:
+                raise ValueError("Un contexte ne peut comporter de crochet")
+            for formal in formals:
+                if not formal.isidentifier():
+                    raise ValueError(f"Paramètre formel invalide : {formal}")
+            variables.extend(formals)
+        self._condition = Expression(condition, variables) if condition and condition.strip() else None
+        self._successor = [(symbol, [Expression(argument, variables) for argument in arguments])
+                           for symbol, arguments in split_modules(successor)]
+        self._production = production.strip()
+
+    @property
+    def symbol(self) -> str:
+        return self._symbol
+
+    @property
+    def is_context_free(self) -> bool:
+        return not self._left and not self._right
+
+    def __repr__(self):
+        return self._production
+
+    def _bind(self, module: Module, symbol: str, formals: List[str], bindings: Dict[str, float]) -> bool:
+        if module[0] != symbol or len(module[1]) != len(formals):
+            return False
+        bindings.update(zip(formals, module[1]))
+        return True
+
+    def match(self, modules: List[Module], at: int, index: BracketIndex) -> Optional[Dict[str, float]]:
+        """
+        Retourne les valeurs des paramètres formels si la production s'applique au module à la
+        position at, None sinon.
+        """
+        bindings = {}
+        if not self._bind(modules[at], self._symbol, self._formals, bindings):
+            return None
+        neighbour = at
+        for symbol, formals in reversed(self._left):
+            neighbour = index.left[neighbour]
+            if neighbour < 0 or not self._bind(modules[neighbour], symbol, formals, bindings):
+                return None
+        neighbour = at
+        for symbol, formals in self._right:
+            neighbour = index.right[neighbour]
+            if neighbour < 0 or not self._bind(modules[neighbour], symbol, formals, bindings):
+                return None
+        if self._condition is not None and not self._condition(bindings):
+            return None
+        return bindings
+
+    def apply(self, bindings: Dict[str, float]) -> List[Module]:
+        return [(symbol, tuple(float(argument(bindings)) for argument in arguments))
+                for symbol, arguments in self._successor]
+
+
+class ContextRules:
+    """
+    Ensemble de productions sensibles au contexte ou paramétriques. Pour chaque module, les
+    productions de son symbole sont essayées dans l'ordre et la première qui s'applique l'emporte;
+    un module sans production applicable est conservé. Les symboles de ignore (typiquement + et -)
+    sont transparents pour les contextes.
+    """
+    def __init__(self, productions: Iterable[Union[str, ContextRule]], ignore: str = ""):
+        self._rules = tuple(rule if isinstance(rule, ContextRule) else ContextRule(rule) for rule in productions)
+        self._ignore = frozenset(ignore)
+        self._by_symbol: Dict[str, List[ContextRule]] = {}
+        for rule in self._rules:
+            self._by_symbol.setdefault(rule.symbol, []).append(rule)
+
+    @property
+    def rules(self) -> Tuple[ContextRule, ...]:
+        return self._rules
+
+    def step(self, modules: List[Module]) -> List[Module]:
+        index = BracketIndex(modules, self._ignore)
+        derived = []
+        for at, module in enumerate(modules):
+            for rule in self._by_symbol.get(module[0], ()):
+                bindings = rule.match(modules, at, index)
+                if bindings is not None:
+                    derived.extend(rule.apply(bindings))
+                    break
+            else:
+                derived.append(module)
+        return derived
+
+    def transform(self, axiom: Union[str, List[Module]], iterations: int) -> List[Module]:
+        modules = parse_modules(axiom) if isinstance(axiom, str) else list(axiom)
+        for _ in range(min(iterations, Constant.MAX_ITERATIONS)):
+            modules = self.step(modules)
+        return modules
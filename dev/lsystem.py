@@ -1,17 +1,24 @@
+from __future__ import annotations
+
 from random import choice, randint
-from tree import Tree, Node, Rules, Rule
+from tree import Tree, Node, Rules, Rule, CompiledRules
 from constant import Constant
-from typing import List, Union
+from typing import List, Union, Dict
+from abc import ABC
+from copy import copy
 
-from lib import *
 from util import clamp, Bounds
+from encoding import encode
+
+import numpy as np
 from geneticsetup import MutationStrategy, Randomizer, SymbolMutationStrategy
 
 
 class LSystem:
-    def __init__(self, transformation_rules: Rules, tree_structure: Tree, iterations: int, axiom: str, angle: float):
-        if not isinstance(transformation_rules, Rules):
-            raise TypeError("Règles doivent etre de type Rules")
+    def __init__(self, transformation_rules: Union[Rules, CompiledRules], tree_structure: Tree, iterations: int,
+                 axiom: str, angle: float):
+        if not isinstance(transformation_rules, (Rules, CompiledRules)):
+            raise TypeError("Règles doivent etre de type Rules ou CompiledRules")
         if not isinstance(tree_structure, Tree):
             raise TypeError("Arbre doit être de type Tree")
         if not isinstance(iterations, int):
@@ -21,15 +28,25 @@ class LSystem:
         if axiom not in Constant.TERMINAL_SET:
             raise ValueError("Caractère inconnu, doit faire partie de l'alphabet existant")
         
-        self._transformation_rules = transformation_rules.get_rules
+        self._compiled_rules = CompiledRules.of(transformation_rules)
+        self._transformation_rules = self._compiled_rules.get_rules
         self._tree = tree_structure
-        self._value = tree_structure.solution()
         self._iterations = iterations
         self._axiom = axiom
         self._angle = angle
-        self._line_vector = None
+        self._segments = None
         self._bounds = None
 
+    def __copy__(self) -> LSystem:
+        """
+        Copie dont l'arbre partage ses nodes avec l'original : les stratégies de croisement et de
+        mutation ne copient que les nodes qu'elles modifient.
+        """
+        lsystem = self.__class__.__new__(self.__class__)
+        lsystem.__dict__.update(self.__dict__)
+        lsystem._tree = copy(self._tree)
+        return lsystem
+
     @property
     def bounds(self) -> Bounds:
         return self._bounds
@@ -39,12 +56,12 @@ class LSystem:
         self._bounds = bounds
 
     @property
-    def line_vector(self) -> List[QLineF]:
-        return self._line_vector
+    def segments(self) -> np.ndarray:
+        return self._segments
 
-    @line_vector.setter
-    def line_vector(self, line_vector: List[QLineF]) -> None:
-        self._line_vector = line_vector
+    @segments.setter
+    def segments(self, segments: np.ndarray) -> None:
+        self._segments = segments
 
     @property
     def angle(self) -> float:
@@ -56,7 +73,11 @@ class LSystem:
 
     @property
     def value(self) -> str:
-        return self._value
+        return self._tree.solution()
+
+    @property
+    def codes(self) -> np.ndarray:
+        return encode(self.value)
 
     @property
     def tree(self) -> Tree:
@@ -74,6 +95,20 @@ class LSystem:
     def rules(self) -> List[Rule]:
         return self._transformation_rules
 
+    @property
+    def compiled_rules(self) -> CompiledRules:
+        return self._compiled_rules
+
+    def symbol_counts(self) -> Dict[str, int]:
+        """
+        Nombre de chaque symbole de l'alphabet après dérivation de l'axiome, calculé par
+        puissance de la matrice de croissance sans construire la chaîne.
+        """
+        return self._compiled_rules.symbol_counts(self._axiom, self._iterations)
+
+    def derived_length(self) -> int:
+        return sum(self.symbol_counts().values())
+
     @iterations.setter
     def iterations(self, iterations: int) -> None:
         if not isinstance(iterations, int):
@@ -81,53 +116,51 @@ class LSystem:
         self._iterations = clamp(0, Constant.MAX_ITERATIONS, iterations)
 
     def transform(self) -> None:
-        transformed_value = self._value
-        for i in range(self._iterations):
-            for rule in self._transformation_rules:
-                transformed_value = rule + transformed_value
-        self._value = transformed_value
+        self._tree = Tree(Tree.transform(self._compiled_rules, self._iterations, self.value))
         
 
 class DefaultLSystem(LSystem):
     """
     Arbre par défaut utilisé dans la génération de la population de départ
-    Constructeur initialisé avec des valeurs fixes.
+    Constructeur initialisé avec des valeurs fixes. Les règles, partagées par tous
+    les individus, ne sont compilées qu'une seule fois.
     """
+    _default_rules = CompiledRules([Rule("F=F[+F]F[-F]F")])
+
     def __init__(self):
-        rules = Rules()
-        rule = Rule("F=F[+F]F[-F]F")
-        rules.append(rule)
-        self._transformation_rules = rules
-        self._value = "F"
+        self._compiled_rules = DefaultLSystem._default_rules
+        self._transformation_rules = self._compiled_rules.get_rules
+        self._axiom = "F"
+        self._tree = Tree(self._axiom)
         self._iterations = 4
         self._angle = 25.7
         self.transform()
-        self._tree = Tree(self._value)
         self._mutation_strategy: MutationStrategy = SymbolMutationStrategy()
-        self._mutation_strategy.mutate(self._tree.root)
+        self._tree.root = self._mutation_strategy.mutate(self._tree.root)
 
 
 class RandomLSystem(LSystem):
     """
     Arbre aléatoire utilisé dans la génération de la population de départ.
-    Constructeur initialisé avec des valeurs aléatoires.
+    Constructeur initialisé avec des valeurs aléatoires. Des règles déjà compilées
+    peuvent être fournies, auquel cas seuls l'angle et l'axiome sont aléatoires.
     """
-    def __init__(self):
-        rules = Rules()
-        string_pool = Randomizer.generate_random_string_pool(50)
+    def __init__(self, rules: CompiledRules = None):
         self._iterations = 4
         self._angle = randint(Constant.MIN_ANGLE, Constant.MAX_ANGLE)
-        rules_from = []
-        for i in range(Constant.MAX_RULES):
-            rule_from = choice(string_pool)
-            rules_from.append(rule_from) 
-            rule_to = Randomizer.generate_random_tree(1)
-            rule = Rule(f"{rule_from}={rule_to.solution()}")
-            rules.append(rule)
-        self._transformation_rules = rules
-        self._value = choice(rules_from)
+        if rules is None:
+            rules = Rules()
+            string_pool = Randomizer.generate_random_string_pool(50)
+            for i in range(Constant.MAX_RULES):
+                rule_from = choice(string_pool)
+                rule_to = Randomizer.generate_random_tree(1)
+                rule = Rule(f"{rule_from}={rule_to.solution()}")
+                rules.append(rule)
+        self._compiled_rules = CompiledRules.of(rules)
+        self._transformation_rules = self._compiled_rules.get_rules
+        self._axiom = choice([rule.transform_from for rule in self._compiled_rules])
+        self._tree = Tree(self._axiom)
         self.transform()
-        self._tree = Tree(self._value)
 
 
 class LSystemFactory(ABC):
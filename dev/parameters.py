@@ -1,4 +1,5 @@
 from PySide6.QtGui import QColor
+from constant import Constant
 
 
 class LSystemParameters:
@@ -13,6 +14,8 @@ class LSystemParameters:
         self.polygon_shape: str = None
         self.shape_color: QColor = None
         self.bg_color: QColor = None
+        self.seed: int = Constant.INITIAL_SEED
+        self.progressive: bool = True
 
 
 
@@ -0,0 +1,104 @@
+from typing import Tuple
+
+import numpy as np
+
+from util import Bounds
+
+"""
+Tramage NumPy de segments dans un tampon RGBA (hauteur, largeur, 4) en uint8, sans Qt : utilisable
+depuis n'importe quel fil d'exécution ou sur un serveur sans affichage.
+"""
+Color = Tuple[int, int, int, int]
+
+
+def new_buffer(width: int, height: int, color: Color = (255, 255, 255, 255)) -> np.ndarray:
+    buffer = np.empty((height, width, 4), dtype=np.uint8)
+    buffer[...] = color
+    return buffer
+
+
+def _transform(bounds: Bounds, width: int, height: int) -> Tuple[float, float, float]:
+    scale = bounds.scale(width, height)
+    return (scale, -bounds.min_x + (width / scale - bounds.width) / 2.,
+            -bounds.min_y + (height / scale - bounds.height) / 2.)
+
+
+def viewport(bounds: Bounds, width: int, height: int) -> Tuple[Tuple[float, float, float, float], float]:
+    """
+    Fenêtre (min_x, min_y, max_x, max_y) couverte par l'image et taille d'un pixel, en coordonnées
+    de la tortue.
+    """
+    scale, offset_x, offset_y = _transform(bounds, width, height)
+    return (-offset_x, -offset_y, width / scale - offset_x, height / scale - offset_y), 1. / scale
+
+
+def project(segments: np.ndarray, bounds: Bounds, width: int, height: int) -> np.ndarray:
+    """
+    Coordonnées en pixels des segments, la forme étant centrée et mise à l'échelle comme dans
+    Renderer._bound_image.
+    """
+    scale, offset_x, offset_y = _transform(bounds, width, height)
+    return (segments + (offset_x, offset_y, offset_x, offset_y)) * scale
+
+
+def _samples(segments: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Points échantillonnés le long de chaque segment, au moins un par pixel traversé.
+    """
+    deltas = segments[:, 2:] - segments[:, :2]
+    steps = np.ceil(np.abs(deltas).max(axis=1)).astype(np.intp) + 1
+    owner = np.repeat(np.arange(len(segments)), steps)
+    rank = np.arange(len(owner)) - np.repeat(np.cumsum(steps) - steps, steps)
+    fraction = rank / np.maximum(steps - 1, 1)[owner]
+    points = segments[owner, :2] + fraction[:, None] * deltas[owner]
+    return points[:, 0], points[:, 1]
+
+
+def coverage(segments: np.ndarray, width: int, height: int, antialias: bool = False,
+             max_samples: int = 1 << 22) -> np.ndarray:
+    """
+    Couverture (hauteur, largeur) dans [0, 1] de segments déjà projetés. Sans lissage, chaque
+    échantillon allume son pixel; avec lissage, il est réparti sur les quatre pixels voisins selon
+    sa distance à leur centre. Les segments sont traités par lots d'au plus max_samples
+    échantillons.
+    """
+    covered = np.zeros((height, width), dtype=np.float32)
+    if not len(segments):
+        return covered
+    steps = np.ceil(np.abs(segments[:, 2:] - segments[:, :2]).max(axis=1)) + 1
+    batches = np.searchsorted(np.cumsum(steps), np.arange(max_samples, steps.sum(), max_samples))
+    for batch in np.split(segments, np.unique(batches)):
+        if not len(batch):
+            continue
+        x, y = _samples(batch)
+        if not antialias:
+            column, row = np.floor(x).astype(np.intp), np.floor(y).astype(np.intp)
+            inside = (column >= 0) & (column < width) & (row >= 0) & (row < height)
+            covered[row[inside], column[inside]] = 1.
+            continue
+        x, y = x - .5, y - .5
+        left, top = np.floor(x), np.floor(y)
+        right_weight, bottom_weight = x - left, y - top
+        left, top = left.astype(np.intp), top.astype(np.intp)
+        for column, row, weight in ((left, top, (1 - right_weight) * (1 - bottom_weight)),
+                                    (left + 1, top, right_weight * (1 - bottom_weight)),
+                                    (left, top + 1, (1 - right_weight) * bottom_weight),
+                                    (left + 1, top + 1, right_weight * bottom_weight)):
+            inside = (column >= 0) & (column < width) & (row >= 0) & (row < height)
+            np.maximum.at(covered, (row[inside], column[inside]), weight[inside].astype(np.float32))
+    return covered
+
+
+def draw(buffer: np.ndarray, segments: np.ndarray, color: Color = (0, 0, 0, 255), antialias: bool = False) -> None:
+    """
+    Trace des segments déjà projetés dans buffer, mélangés selon leur couverture et l'opacité de color.
+    """
+    height, width = buffer.shape[:2]
+    blend(buffer, coverage(segments, width, height, antialias), color)
+
+
+def blend(buffer: np.ndarray, covered: np.ndarray, color: Color = (0, 0, 0, 255)) -> None:
+    alpha = covered[..., None] * (color[3] / 255.)
+    touched = alpha[..., 0] > 0
+    paint = np.array(tuple(color[:3]) + (255,), dtype=float)
+    buffer[touched] = np.round(buffer[touched] * (1 - alpha[touched]) + paint * alpha[touched]).astype(np.uint8)
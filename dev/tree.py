@@ -1,10 +1,16 @@
 from __future__ import annotations
 
 from constant import Constant
+from util import matrix_power, LRUCache
+from encoding import ProductionTable, encode, decode
 from typing import Dict
-from copy import deepcopy
-from typing import List
+from copy import copy, deepcopy
+from typing import List, Iterable, Generator, Tuple, Optional, Union
 from random import choices, seed, randint
+import re
+from types import MappingProxyType
+
+import numpy as np
 
 
 class Rules(list):
@@ -17,7 +23,7 @@ class Rules(list):
     """
     def __init__(self, *args):
         list.__init__(self, *args)
-        self._probability: float = 0.
+        self._probability: float = sum(rule.probability for rule in super().__iter__())
 
     @property
     def get_rules(self) -> List[Rule]:
@@ -34,10 +40,171 @@ class Rules(list):
         self._probability += to_append.probability
 
     def __iter__(self):
-        if sum(rule.probability for rule in super().__iter__()) > 1:
+        if self._probability > 1:
             return super().__iter__()
         return iter(choices(self, weights=[rule.probability for rule in super().__iter__()], k=1))
 
+    @property
+    def is_deterministic(self) -> bool:
+        return len(self) <= 1 or self._probability > 1
+
+    @property
+    def is_predictable(self) -> bool:
+        return self.compile().is_predictable
+
+    _compiled: CompiledRules = None
+
+    def compile(self) -> CompiledRules:
+        """
+        Compilées une seule fois, puis à nouveau seulement si la liste de règles a changé.
+        """
+        rules = tuple(super().__iter__())
+        if self._compiled is None or self._compiled.rules != rules:
+            self._compiled = CompiledRules(rules)
+        return self._compiled
+
+    def growth_matrix(self) -> List[List[int]]:
+        return self.compile().growth_matrix()
+
+    def symbol_counts(self, axiom: str, iterations: int) -> Dict[str, int]:
+        return self.compile().symbol_counts(axiom, iterations)
+
+    def derived_length(self, axiom: str, iterations: int) -> int:
+        return self.compile().derived_length(axiom, iterations)
+
+
+class CompiledRules:
+    """
+    Ensemble de règles immuable, validé une seule fois. Les symboles sont internés selon
+    Constant.SYMBOL_CODES; la table de productions, l'expression régulière des prédécesseurs et
+    les probabilités cumulées sont précalculées, la table codée l'étant au premier usage. Hachable, l'objet peut servir
+    de clé de cache. Contrairement à Rules, l'itération retourne toujours toutes les règles.
+    """
+    def __init__(self, rules: Iterable[Rule]):
+        rule_list = rules.get_rules if isinstance(rules, Rules) else list(rules)
+        probability = 0.
+        for rule in rule_list:
+            if not isinstance(rule, Rule):
+                raise TypeError("Objet doit être type Rule")
+            if rule.is_weighted and rule.probability + probability > 1.:
+                raise ValueError("Probabilite totale ne peut etre superieure a 1")
+            probability += rule.probability
+        self._rules: Tuple[Rule, ...] = tuple(rule_list)
+        self._key = tuple((rule.transform_from, rule.transform_to, rule.probability) for rule in rule_list)
+        self._is_deterministic = len(rule_list) <= 1 or probability > 1
+        self._productions = MappingProxyType(Tree.productions(rule_list))
+        self._has_single_predecessors = all(len(predecessor) == 1 for predecessor in self._productions)
+        self._translation = str.maketrans(dict(self._productions)) if self._has_single_predecessors else None
+        predecessors = sorted(self._productions, key=len, reverse=True)
+        self._pattern = re.compile("(" + "|".join(re.escape(predecessor) for predecessor in predecessors) + ")") \
+            if predecessors else None
+        self._production_table: Optional[ProductionTable] = None
+        cumulative = np.cumsum([rule.probability for rule in rule_list], dtype=float)
+        if rule_list and not cumulative[-1] > 0:
+            raise ValueError("Probabilite totale doit etre superieure a 0")
+        self._cumulative = cumulative / cumulative[-1] if rule_list else cumulative
+
+    @staticmethod
+    def of(rules: Union[Iterable[Rule], CompiledRules]) -> CompiledRules:
+        return rules if isinstance(rules, CompiledRules) else CompiledRules(rules)
+
+    @property
+    def rules(self) -> Tuple[Rule, ...]:
+        return self._rules
+
+    @property
+    def get_rules(self) -> List[Rule]:
+        return list(self._rules)
+
+    @property
+    def productions(self) -> MappingProxyType:
+        return self._productions
+
+    @property
+    def production_table(self) -> ProductionTable:
+        """
+        Table de productions codées en uint8, construite au premier usage.
+        """
+        if not self._has_single_predecessors:
+            raise ValueError("Codage impossible pour un prédécesseur de plusieurs caractères")
+        if self._production_table is None:
+            variants = [self._productions] if self._is_deterministic else \
+                [{rule.transform_from: rule.transform_to} for rule in self._rules]
+            self._production_table = ProductionTable(variants, self._productions)
+        return self._production_table
+
+    @property
+    def translation(self) -> Optional[Dict[int, str]]:
+        return self._translation
+
+    @property
+    def pattern(self) -> Optional[re.Pattern]:
+        return self._pattern
+
+    @property
+    def cumulative_probabilities(self) -> np.ndarray:
+        return self._cumulative
+
+    @property
+    def is_deterministic(self) -> bool:
+        return self._is_deterministic
+
+    @property
+    def has_single_predecessors(self) -> bool:
+        return self._has_single_predecessors
+
+    @property
+    def is_predictable(self) -> bool:
+        return self._is_deterministic and self._has_single_predecessors
+
+    def __iter__(self):
+        return iter(self._rules)
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    def __hash__(self) -> int:
+        return hash(self._key)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CompiledRules) and self._key == other._key
+
+    def __reduce__(self):
+        return CompiledRules, (self._rules,)
+
+    def __deepcopy__(self, memo) -> CompiledRules:
+        return self
+
+    def draw(self, generator: np.random.Generator, size: int) -> np.ndarray:
+        """
+        Indices de règles tirés selon leurs probabilités, en un seul lot.
+        """
+        return np.searchsorted(self._cumulative, generator.random(size), side="right")
+
+    def growth_matrix(self) -> List[List[int]]:
+        """
+        Matrice de croissance sur Constant.ALPHABET : la colonne j contient le nombre d'occurrences
+        de chaque symbole dans la production du symbole j (identité si aucune règle ne s'applique).
+        Le vecteur de Parikh de l'itération n est alors M^n multiplié par celui de l'axiome.
+        """
+        if not self.is_predictable:
+            raise ValueError("Prédiction impossible pour un système stochastique ou à prédécesseurs multiples")
+        matrix = [[0 for _ in Constant.ALPHABET] for _ in Constant.ALPHABET]
+        for j, symbol in enumerate(Constant.ALPHABET):
+            production = self._productions.get(symbol, symbol)
+            for i, other_symbol in enumerate(Constant.ALPHABET):
+                matrix[i][j] = production.count(other_symbol)
+        return matrix
+
+    def symbol_counts(self, axiom: str, iterations: int) -> Dict[str, int]:
+        matrix = matrix_power(self.growth_matrix(), iterations)
+        axiom_counts = [axiom.count(symbol) for symbol in Constant.ALPHABET]
+        return {symbol: sum(count * axiom_count for count, axiom_count in zip(row, axiom_counts))
+                for symbol, row in zip(Constant.ALPHABET, matrix)}
+
+    def derived_length(self, axiom: str, iterations: int) -> int:
+        return sum(self.symbol_counts(axiom, iterations).values())
+
 
 class Rule:
     def __init__(self, transformation_rule: str, probability: float = 1):
@@ -64,12 +231,11 @@ class Rule:
     def is_weighted(self) -> bool:
         return not self.probability == 1
 
+    _valid_chars = frozenset(Constant.ALPHABET + ["="])
+
     @staticmethod
     def is_well_formed(transformation_rule: str) -> bool:
-        for char in transformation_rule:
-            if char not in Constant.ALPHABET + ["="]:
-                return False
-        return True
+        return Rule._valid_chars.issuperset(transformation_rule)
 
     def __add__(self, string_value: str) -> str:
         if not isinstance(string_value, str):
@@ -81,7 +247,9 @@ class Rule:
 
 
 class Tree:
-    def __init__(self, value: str):
+    def __init__(self, value: Union[str, np.ndarray]):
+        if isinstance(value, np.ndarray):
+            value = decode(value)
         self.validate_entry(value)
         self.root = Node(value)
 
@@ -102,9 +270,32 @@ class Tree:
         return self.root.value[index]
 
     def solution(self) -> str:
-        sol = [""]
-        self.root.rebuild(sol)
-        return sol[0]
+        return self.root.solution()
+
+    def __copy__(self) -> Tree:
+        """
+        Copie partageant la racine : les nodes ne sont jamais modifiées en place une fois partagées,
+        une modification passant par copy_path.
+        """
+        tree = Tree.__new__(Tree)
+        tree.root = self.root
+        return tree
+
+    def copy_path(self, path: Iterable[int]) -> List[Node]:
+        """
+        Copie la racine et chaque node du chemin menant à la node désignée par les indices d'enfants
+        de path; les autres sous-arborescences restent partagées. Retourne les copies, de la racine
+        à la node désignée, que l'appelant peut modifier puis invalider sans affecter les arbres
+        partageant les originaux.
+        """
+        node = self.root = copy(self.root)
+        nodes = [node]
+        for index in path:
+            child = copy(node.child[index])
+            node.child[index] = child
+            nodes.append(child)
+            node = child
+        return nodes
 
     def validate_entry(self, value: str) -> None:
         brace_count = 0
@@ -119,49 +310,345 @@ class Tree:
             raise ValueError("Chaine invalide")
 
     @staticmethod
-    def transform(rules: Rules, iterations: int, value: str) -> str:
+    def productions(rules: Iterable[Rule]) -> Dict[str, str]:
+        """
+        Table prédécesseur -> successeur d'un système déterministe. Si deux règles partagent le
+        même prédécesseur, la première l'emporte.
+        """
+        productions = {}
+        for rule in rules:
+            productions.setdefault(rule.transform_from, rule.transform_to)
+        return productions
+
+    @staticmethod
+    def generator(seed: Optional[int], iteration: int) -> np.random.Generator:
+        """
+        Générateur propre à chaque itération : une dérivation peut ainsi reprendre à partir d'une
+        itération en cache et demeurer reproductible pour une même graine.
+        """
+        return np.random.default_rng(None if seed is None else (seed, iteration))
+
+    @staticmethod
+    def stochastic_rewrite(rules: CompiledRules, value: str, generator: np.random.Generator) -> str:
+        """
+        Réécriture stochastique : une règle est tirée pour chaque occurrence d'un prédécesseur, tous
+        les tirages de l'itération étant effectués d'un seul coup. Si la règle tirée ne s'applique
+        pas au prédécesseur rencontré, celui-ci est conservé.
+        """
+        pieces = rules.pattern.split(value)
+        matches = pieces[1::2]
+        drawn_rules = rules.draw(generator, len(matches)).tolist()
+        pieces[1::2] = [rules.rules[drawn].transform_to if rules.rules[drawn].transform_from == match else match
+                        for drawn, match in zip(drawn_rules, matches)]
+        return "".join(pieces)
+
+    @staticmethod
+    def step_codes(rules: CompiledRules, codes: np.ndarray, seed: Optional[int] = None,
+                   iteration: int = 0) -> np.ndarray:
+        """
+        Étape de dérivation sur une chaîne codée : indexation de la table de productions puis
+        concaténation vectorisées. Les tirages stochastiques sont ceux de Tree.stochastic_rewrite.
+        """
+        if rules.pattern is None:
+            return codes
+        if not rules.has_single_predecessors:
+            return encode(Tree.step(rules, decode(codes), seed, iteration))
+        table = rules.production_table
+        if not table.is_stochastic:
+            return table.step(codes)
+        predecessors = table.predecessor_mask(codes)
+        variants = np.zeros(len(codes), dtype=np.intp)
+        variants[predecessors] = rules.draw(Tree.generator(seed, iteration), np.count_nonzero(predecessors))
+        return table.step(codes, variants)
+
+    @staticmethod
+    def step(rules: CompiledRules, value: str, seed: Optional[int] = None, iteration: int = 0) -> str:
+        if rules.pattern is None:
+            return value
+        if not rules.is_deterministic:
+            if rules.has_single_predecessors:
+                return decode(Tree.step_codes(rules, encode(value), seed, iteration))
+            return Tree.stochastic_rewrite(rules, value, Tree.generator(seed, iteration))
+        if rules.translation is not None:
+            return value.translate(rules.translation)
+        return rules.pattern.sub(lambda match: rules.productions[match.group(0)], value)
+
+    @staticmethod
+    def transform(rules: Union[Iterable[Rule], CompiledRules], iterations: int, value: str,
+                  seed: Optional[int] = None) -> str:
+        rules = CompiledRules.of(rules)
         transformed_value = value
         num_iterations = min(iterations, Constant.MAX_ITERATIONS)
         for i in range(num_iterations):
-            for rule in rules:
-                transformed_value = rule + transformed_value
+            transformed_value = Tree.step(rules, transformed_value, seed, i)
         return transformed_value
 
+    @staticmethod
+    def transform_codes(rules: Union[Iterable[Rule], CompiledRules], iterations: int,
+                        value: Union[str, np.ndarray], seed: Optional[int] = None) -> np.ndarray:
+        rules = CompiledRules.of(rules)
+        codes = encode(value) if isinstance(value, str) else value
+        num_iterations = min(iterations, Constant.MAX_ITERATIONS)
+        for i in range(num_iterations):
+            codes = Tree.step_codes(rules, codes, seed, i)
+        return codes
+
+    @staticmethod
+    def _draws(rules: CompiledRules, generator: np.random.Generator,
+               batch_size: int = 4096) -> Generator[int, None, None]:
+        """
+        Tirages par lots; la séquence obtenue est identique à celle d'un tirage unique de même longueur.
+        """
+        while True:
+            yield from rules.draw(generator, batch_size).tolist()
+
+    @staticmethod
+    def max_iterations(rules: CompiledRules) -> int:
+        """
+        Itérations accessibles sans matérialiser la chaîne : seuls les prédécesseurs d'un seul
+        caractère se prêtent à la dérivation paresseuse.
+        """
+        return Constant.MAX_LAZY_ITERATIONS if rules.has_single_predecessors else Constant.MAX_ITERATIONS
+
+    @staticmethod
+    def validate_iterations(rules: CompiledRules, iterations: int) -> None:
+        if not rules.has_single_predecessors and iterations > Constant.MAX_ITERATIONS:
+            raise ValueError(f"Au plus {Constant.MAX_ITERATIONS} itérations avec des prédécesseurs de plusieurs caractères")
+
+    @staticmethod
+    def derive(rules: Union[Iterable[Rule], CompiledRules], iterations: int, value: str,
+               seed: Optional[int] = None) -> Generator[str, None, None]:
+        """
+        Dérivation paresseuse : les symboles de l'itération n sont produits un à un, en profondeur,
+        en développant récursivement l'axiome à travers les règles. La pile contient au plus une
+        production par itération, la mémoire croît donc avec le nombre d'itérations et non avec la
+        longueur de la chaîne dérivée. Seuls les prédécesseurs d'un seul caractère se prêtent à
+        ce développement; sinon, la chaîne est transformée puis parcourue, ce qui limite les
+        itérations à Constant.MAX_ITERATIONS (voir max_iterations). Pour une même graine, les
+        tirages stochastiques sont ceux de Tree.transform, chaque niveau étant visité de gauche à
+        droite.
+        """
+        rules = CompiledRules.of(rules)
+        Tree.validate_iterations(rules, iterations)
+        num_iterations = min(iterations, Constant.MAX_LAZY_ITERATIONS)
+        if not rules.has_single_predecessors:
+            yield from Tree.transform(rules, iterations, value, seed)
+            return
+        productions = rules.productions
+        if rules.is_deterministic:
+            def successor(level: int, char: str) -> Optional[str]:
+                return productions.get(char)
+        else:
+            draws = [Tree._draws(rules, Tree.generator(seed, level)) for level in range(num_iterations)]
+
+            def successor(level: int, char: str) -> Optional[str]:
+                if char not in productions:
+                    return None
+                rule = rules.rules[next(draws[level])]
+                return rule.transform_to if rule.transform_from == char else None
+
+        stack = [(iter(value), 0)]
+        while stack:
+            symbols, level = stack[-1]
+            char = next(symbols, None)
+            if char is None:
+                stack.pop()
+                continue
+            production = None
+            while level < num_iterations:
+                production = successor(level, char)
+                if production is not None:
+                    break
+                level += 1
+            if production is None:
+                yield char
+            else:
+                stack.append((iter(production), level + 1))
+
+
+class Derivation:
+    """
+    Dérivation non matérialisée : règles, nombre d'itérations et axiome. Lorsque les règles sont
+    prévisibles, chaque symbole développé un même nombre de fois produit la même sous-arborescence,
+    que Turtle interprète une seule fois par cap (voir InstanceCache); sinon, les symboles sont
+    parcourus un à un par Tree.derive.
+    """
+    def __init__(self, rules: Union[Iterable[Rule], CompiledRules], iterations: int, axiom: str,
+                 seed: Optional[int] = None):
+        self._rules = CompiledRules.of(rules)
+        Tree.validate_iterations(self._rules, iterations)
+        self._iterations = min(iterations, Tree.max_iterations(self._rules))
+        self._axiom = axiom
+        self._seed = seed
+
+    @property
+    def rules(self) -> CompiledRules:
+        return self._rules
+
+    @property
+    def iterations(self) -> int:
+        return self._iterations
+
+    @property
+    def axiom(self) -> str:
+        return self._axiom
+
+    @property
+    def is_instanceable(self) -> bool:
+        return self._rules.is_predictable and not any(predecessor in Constant.FUNCTION_SET
+                                                      for predecessor in self._rules.productions)
+
+    def symbols(self) -> Generator[str, None, None]:
+        return Tree.derive(self._rules, self._iterations, self._axiom, self._seed)
+
+
+class DerivationCache:
+    """
+    Cache LRU des dérivations codées, indexé par (axiome, règles, probabilités, itération) et borné
+    par un budget mémoire exprimé en nombre de symboles, soit en octets. Passer de l'itération n à
+    n + 1 réécrit une seule fois la chaîne de l'itération n déjà en cache plutôt que de repartir
+    de l'axiome.
+    Les systèmes stochastiques ne sont mis en cache que si une graine est fournie.
+    La longueur des dérivations stochastiques ou à prédécesseurs multiples n'étant pas prévisible,
+    max_length permet d'abandonner, en retournant None, dès qu'une itération la dépasse.
+    """
+    def __init__(self, memory_budget: int = Constant.DERIVATION_CACHE_BUDGET):
+        self._cache = LRUCache(memory_budget, len)
+
+    @property
+    def memory_budget(self) -> int:
+        return self._cache.capacity
+
+    @property
+    def cache(self) -> LRUCache:
+        return self._cache
+
+    @staticmethod
+    def key(rules: CompiledRules, axiom: str, seed: Optional[int] = None) -> Tuple:
+        return axiom, rules, None if rules.is_deterministic else seed
+
+    def transform_codes(self, rules: Union[Rules, CompiledRules], iterations: int, axiom: str,
+                        seed: Optional[int] = None, max_length: Optional[int] = None) -> Optional[np.ndarray]:
+        rules = CompiledRules.of(rules)
+        if not rules.is_deterministic and seed is None:
+            return Tree.transform_codes(rules, iterations, axiom)
+        key = DerivationCache.key(rules, axiom, seed)
+        num_iterations = min(iterations, Constant.MAX_ITERATIONS)
+        start, codes = 0, encode(axiom)
+        for cached_iterations in range(num_iterations, 0, -1):
+            cached_codes = self._cache.get(key + (cached_iterations,))
+            if cached_codes is not None:
+                start, codes = cached_iterations, cached_codes
+                break
+        for i in range(start, num_iterations):
+            codes = Tree.step_codes(rules, codes, seed, i)
+            if max_length is not None and len(codes) > max_length:
+                return None
+            self._cache.put(key + (i + 1,), codes)
+        return codes
+
 
 class Node:
     def __init__(self, value: str):
-        self.value = ""
+        """
+        Analyse en une seule passe linéaire : chaque node ouverte possède son tampon de symboles,
+        joint à la fermeture de son crochet.
+        """
         self.child: List[Node] = []
-        brace_count = 0
-        start = -1
-        for curr, char in enumerate(value):
+        nodes = [self]
+        buffers = [[]]
+        for char in value:
             if char == "[":
-                if start == -1:
-                    start = curr
-                else:
-                    brace_count += 1
-            if char == "]":
-                if not brace_count:
-                    self.child.append(Node(value[start + 1:curr]))
-                    self.value = self.value + "$"
-                    start = -1
-                else:
-                    brace_count -= 1
-            if start == -1 and char != "]":
-                self.value = self.value + char
+                node = Node.__new__(Node)
+                node.child = []
+                nodes[-1].child.append(node)
+                buffers[-1].append(Constant.PLACEHOLDER)
+                nodes.append(node)
+                buffers.append([])
+            elif char == "]":
+                if len(nodes) == 1:
+                    raise ValueError("Chaine invalide")
+                nodes.pop().value = "".join(buffers.pop())
+            else:
+                buffers[-1].append(char)
+        if len(nodes) != 1:
+            raise ValueError("Chaine invalide")
+        self.value = "".join(buffers[0])
+
+    _solution: str = None
+    _contribution: object = None
+
+    @property
+    def value(self) -> str:
+        return self._value
+
+    @value.setter
+    def value(self, value: str) -> None:
+        self._value = value
+        self._solution = None
+        self._contribution = None
+
+    @property
+    def child(self) -> List[Node]:
+        return self._child
+
+    @child.setter
+    def child(self, child: List[Node]) -> None:
+        self._child = child
+        self._solution = None
+        self._contribution = None
+
+    @property
+    def contribution(self) -> object:
+        """
+        Contribution de la sous-arborescence à l'interprétation, indépendante de l'angle (voir
+        geometry.node_contribution), effacée à chaque invalidation comme la solution.
+        """
+        return self._contribution
+
+    @contribution.setter
+    def contribution(self, contribution: object) -> None:
+        self._contribution = contribution
+
+    @property
+    def is_dirty(self) -> bool:
+        return self._solution is None
+
+    def __copy__(self) -> Node:
+        """
+        Copie superficielle : la valeur, les enfants ainsi que la solution et la contribution, qui
+        restent valides tant que la copie n'est pas modifiée, sont partagés; seule la liste
+        d'enfants est propre à la copie.
+        """
+        node = Node.__new__(Node)
+        node._value = self._value
+        node._child = list(self._child)
+        node._solution = self._solution
+        node._contribution = self._contribution
+        return node
+
+    def invalidate(self) -> None:
+        """
+        Les modifications en place de la liste d'enfants ou d'un descendant ne sont pas détectées :
+        la stratégie qui les effectue doit invalider la node modifiée et chacun de ses ancêtres.
+        Les nodes étant partagées entre individus, seules des copies (voir Tree.copy_path) sont
+        modifiées en place.
+        """
+        self._solution = None
+        self._contribution = None
 
     def rebuild(self, sol: List[str]):
-        i = 0
-        for char in self.value:
-            if char != "$":
-                sol[0] = sol[0] + char
-            else:
-                sol[0] = sol[0] + "["
-                self.child[i].rebuild(sol)
-                i += 1
-                sol[0] = sol[0] + "]"
+        sol[0] = sol[0] + self.solution()
 
     def solution(self) -> str:
-        sol = [""]
-        self.rebuild(sol)
-        return sol[0]
+        """
+        Chaîne de la sous-arborescence, conservée jusqu'à la prochaine invalidation. Seules les
+        sous-arborescences invalidées sont reconstruites, chacune par une seule jonction.
+        """
+        if self._solution is None:
+            pieces = self._value.split(Constant.PLACEHOLDER)
+            sol = [pieces[0]]
+            for i, piece in enumerate(pieces[1:]):
+                sol.extend(("[", self._child[i].solution(), "]", piece))
+            self._solution = "".join(sol)
+        return self._solution
@@ -1,105 +1,26 @@
 from __future__ import annotations
 from lib import *
-from constant import Constant
-from tree import *
-from util import Bounds, clamp
+from geometry import Turtle
+import raster
 
-from math import sin, cos, radians, pi
+import numpy as np
+from util import Bounds
 
-from __feature__ import snake_case, true_property
-
-
-class Turtle:
-    def __init__(self, tree: Tree, rotation_angle: float, segment_length: float = 5.):
-        if not isinstance(tree, Tree):
-            raise TypeError("Arbre doit être de type Tree")
-        self._segment_length = segment_length
-        self._tree = tree
-        self._centroid: QPointF = QPointF(0, 0)
-        self._turtle_start = QPointF(0, 0)
-        self._current_position: QPointF = self._turtle_start
-        self._heading: float = -90.
-        self._rotation_angle: float = rotation_angle
-        self._stack_positions: List[QPointF] = []
-        self._stack_angles: List[float] = []
-        self._point_vector: List[QPointF] = [self._turtle_start]
-        self._line_vector: List[QLineF] = []
-        self._current_node: Tree._Node = self._tree.root
-        self._at = 0
-        self._bounds = Bounds()
-
-    @property
-    def point_vector(self) -> List[QPointF]:
-        return self._point_vector
-
-    @property
-    def centroid(self) -> QPointF:
-        return self._centroid / len(self._point_vector)
-
-    @property
-    def line_vector(self) -> List[QLineF]:
-        return self._line_vector
-
-    @property
-    def bounds(self) -> Bounds:
-        return self._bounds
-
-    def parse(self) -> None:
-        self.parser(self._current_node)
-
-    def parser(self, node: Tree._Node) -> None:
-        """
-        TODO Remplacer par un switch case (disponible en Python 3.10)
-        """
-        at = 0
-        for char in node.value:
-            if char == "+":
-                self._rotate_left()
-            if char == "-":
-                self._rotate_right()
-            if char == "F":
-                self._draw_straight_line()
-            if char == "$":
-                self._stack_positions.append(self._current_position)
-                self._stack_angles.append(self._heading)
-                self.parser(node.child[at])
-                at += 1
-                self._current_position = self._stack_positions.pop()
-                self._heading = self._stack_angles.pop()
+from typing import List
 
-    def _stack_turtle(self):
-        self._current_node = self._current_node.child[self._at] if self._current_node.child else self._current_node
-        self._stack_positions.append(self._current_position)
-        self._stack_angles.append(self._heading)
-        self.parser(self._current_node)
-        self._at += 1
-        self._heading = self._stack_angles.pop()
-
-    def _draw_straight_line(self):
-        x_coord = cos(radians(self._heading)) * self._segment_length + self._current_position.x()
-        y_coord = sin(radians(self._heading)) * self._segment_length + self._current_position.y()
-
-        self.bounds.update(x_coord, y_coord)
-
-        next_position = QPointF(x_coord, y_coord)
-
-        self._point_vector.append(next_position)
-
-        self._centroid = self._centroid + next_position         
-
-        self._line_vector.append(QLineF(self._current_position, next_position))
-        self._current_position = next_position
-
-    def _rotate_right(self):
-        self._heading -= self._rotation_angle
-
-    def _rotate_left(self):
-        self._heading += self._rotation_angle
+from __feature__ import snake_case, true_property
 
 
 class Renderer:
-    def __init__(self, bounds: Bounds, line_vector: List[QLineF], image_width: int = 400, image_height: int = 500,
-                 bg_color: QColor = QColor(255, 255, 255), shape_color: QColor = QColor(0, 0, 0)):
+    """
+    Seul point de contact entre la géométrie et Qt. Le tracé se fait dans une QImage, utilisable
+    hors du fil graphique : soit par QPainter, les segments (N, 4) n'étant convertis en QLineF
+    qu'au moment du tracé, soit par le tramage NumPy de raster lorsque use_numpy est vrai. Seul
+    pixmap exige le fil graphique.
+    """
+    def __init__(self, bounds: Bounds, segments: np.ndarray, image_width: int = 400, image_height: int = 500,
+                 bg_color: QColor = QColor(255, 255, 255), shape_color: QColor = QColor(0, 0, 0),
+                 antialias: bool = False, use_numpy: bool = False):
         if not isinstance(bounds, Bounds):
             raise TypeError("Limites doivent être de type Bounds")
         if not isinstance(bg_color, QColor):
@@ -111,9 +32,14 @@ class Renderer:
         self._image_height = image_height
         self._bg_color = bg_color
         self._shape_color = shape_color
-        self._line_vector = line_vector
-        self._pixmap = QPixmap(image_width, image_height)
-        self._pixmap.fill(self._bg_color)
+        self._segments = segments
+        self._antialias = antialias
+        self._use_numpy = use_numpy
+        if use_numpy:
+            self._buffer = raster.new_buffer(image_width, image_height, bg_color.get_rgb())
+        else:
+            self._image = QImage(image_width, image_height, QImage.Format_ARGB32_Premultiplied)
+            self._image.fill(self._bg_color)
 
     @property
     def bounds(self) -> Bounds:
@@ -124,12 +50,16 @@ class Renderer:
         self._bounds = bounds
 
     @property
-    def line_vector(self) -> List[QLineF]:
-        return self._line_vector
+    def segments(self) -> np.ndarray:
+        return self._segments
 
-    @line_vector.setter
-    def line_vector(self, line_vector: List[QLineF]) -> None:
-        self._line_vector = line_vector
+    @segments.setter
+    def segments(self, segments: np.ndarray) -> None:
+        self._segments = segments
+
+    @staticmethod
+    def to_lines(segments: np.ndarray) -> List[QLineF]:
+        return [QLineF(*segment) for segment in segments.tolist()]
 
     @property
     def shape_color(self) -> QColor:
@@ -146,14 +76,27 @@ class Renderer:
                           -self._bounds.min_y + (self._image_height / scale - self._bounds.height) / 2.)
 
     def _render(self) -> None:
+        if self._use_numpy:
+            raster.draw(self._buffer, raster.project(self._segments, self._bounds, self._image_width,
+                                                     self._image_height),
+                        self._shape_color.get_rgb(), self._antialias)
+            return
         pen = QPen(self._shape_color)
-        painter = QPainter(self._pixmap)
+        painter = QPainter(self._image)
+        painter.set_render_hint(QPainter.Antialiasing, self._antialias)
         self._bound_image(painter)
         painter.set_pen(pen)
-        painter.draw_lines(self._line_vector)
+        painter.draw_lines(Renderer.to_lines(self._segments))
         painter.end()
 
     @property
-    def pixmap(self) -> QPixmap:
+    def image(self) -> QImage:
         self._render()
-        return self._pixmap
+        if self._use_numpy:
+            return QImage(self._buffer.data, self._image_width, self._image_height, 4 * self._image_width,
+                          QImage.Format_RGBA8888).copy()
+        return self._image
+
+    @property
+    def pixmap(self) -> QPixmap:
+        return QPixmap.from_image(self.image)
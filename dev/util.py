@@ -1,5 +1,6 @@
-from typing import Generator, Union, Tuple
+from typing import Generator, Union, Tuple, List, Any, Callable, Hashable
 from math import acos, degrees, exp
+from collections import OrderedDict
 
 
 def int_generator(steps: int, lower_bound: int = 0, upper_bound=15) -> Generator:
@@ -14,6 +15,21 @@ def clamp(minimum: Union[int, float], maximum: Union[int, float], value: Union[i
 def sigmoid(x) -> float:
     return 1 / (1 + exp(-x))
 
+def matrix_product(a: List[List[int]], b: List[List[int]]) -> List[List[int]]:
+    return [[sum(a_ik * b[k][j] for k, a_ik in enumerate(row)) for j in range(len(b[0]))] for row in a]
+
+def matrix_power(matrix: List[List[int]], exponent: int) -> List[List[int]]:
+    """
+    Exponentiation rapide en entiers Python, donc exacte quelle que soit la taille du résultat.
+    """
+    result = [[int(i == j) for j in range(len(matrix))] for i in range(len(matrix))]
+    while exponent > 0:
+        if exponent & 1:
+            result = matrix_product(result, matrix)
+        matrix = matrix_product(matrix, matrix)
+        exponent >>= 1
+    return result
+
 
 class Bounds:
     def __init__(self):
@@ -28,6 +44,12 @@ class Bounds:
         self._min_y = min(y, self._min_y)
         self._max_y = max(y, self._max_y)
 
+    def extend(self, min_x: float, max_x: float, min_y: float, max_y: float):
+        self._min_x = min(min_x, self._min_x)
+        self._max_x = max(max_x, self._max_x)
+        self._min_y = min(min_y, self._min_y)
+        self._max_y = max(max_y, self._max_y)
+
     @property
     def x_center(self) -> float:
         return self.width / 2
@@ -80,6 +102,14 @@ class Point:
         self._x = x
         self._y = y
 
+    @property
+    def x(self) -> float:
+        return self._x
+
+    @property
+    def y(self) -> float:
+        return self._y
+
     def __add__(self, other):
         if isinstance(other, int) or isinstance(other, float):
             self._x += other
@@ -94,3 +124,64 @@ class Point:
 
     def __radd__(self, other):
         return self.__add__(other)
+
+
+class LRUCache:
+    """
+    Cache borné à éviction LRU. La taille de chaque entrée est donnée par size_of (1 par défaut),
+    de sorte que la capacité peut représenter un nombre d'entrées ou un budget mémoire.
+    Une entrée plus grande que la capacité n'est jamais conservée.
+    """
+    def __init__(self, capacity: int, size_of: Callable[[Any], int] = lambda value: 1):
+        self._capacity = capacity
+        self._size_of = size_of
+        self._entries: OrderedDict = OrderedDict()
+        self._size: int = 0
+        self._hits: int = 0
+        self._misses: int = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def hits(self) -> int:
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if key not in self._entries:
+            self._misses += 1
+            return default
+        self._hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if key in self._entries:
+            self._size -= self._size_of(self._entries.pop(key))
+        value_size = self._size_of(value)
+        if value_size > self._capacity:
+            return
+        while self._entries and self._size + value_size > self._capacity:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= self._size_of(evicted)
+        self._entries[key] = value
+        self._size += value_size
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._size = 0